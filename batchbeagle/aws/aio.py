@@ -0,0 +1,497 @@
+"""
+asyncio counterparts of :py:class:`batchbeagle.aws.batch.BatchManager` and
+friends, for callers that already run an event loop.
+
+This module needs Python 3 and aiobotocore; install batchbeagle with the
+``async`` extra to get it::
+
+    pip install batchbeagle[async]
+
+Usage::
+
+    async with make_async_batch_client() as batch:
+        mgr = AsyncBatchManager(batch, yml=Config().get_yaml())
+        report = await mgr.submit_many('sweep', 'job1', 'queue1', rows)
+        await mgr.wait_for_jobs(report.job_ids)
+"""
+import asyncio
+import itertools
+import time
+
+from aiobotocore.config import AioConfig
+from aiobotocore.session import get_session
+
+from batchbeagle.aws.batch import (
+    BatchManager,
+    ComputeEnvironment,
+    JobDefinition,
+    JobTracker,
+    Queue,
+    ResourceError,
+    SubmitReport,
+    SubmitResult,
+)
+from batchbeagle.poll import Poller
+
+
+def make_async_batch_client(session=None, max_pool_connections=50, retry_mode='standard', max_attempts=5,
+                            connect_timeout=10, read_timeout=60, endpoint_url=None):
+    """
+    The async counterpart of :py:func:`batchbeagle.aws.client.make_batch_client`.
+    Returns an async context manager that yields the client.
+
+    :param session: the ``aiobotocore.session.AioSession`` to use.  Default: a new one
+    :param endpoint_url: talk to this endpoint instead of AWS, e.g. a local
+                         ``moto_server``
+    """
+    if session is None:
+        session = get_session()
+    config = AioConfig(
+        max_pool_connections=max_pool_connections,
+        retries={'mode': retry_mode, 'max_attempts': max_attempts},
+        connect_timeout=connect_timeout,
+        read_timeout=read_timeout
+    )
+    return session.create_client('batch', config=config, endpoint_url=endpoint_url)
+
+
+class AsyncPoller(Poller):
+    """
+    A :py:class:`batchbeagle.poll.Poller` whose ``check`` is a coroutine
+    function and whose sleeps give the event loop back.
+    """
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+        self.slept += seconds
+
+    async def wait(self, check, until=bool):
+        pace = self._pacer()
+        while True:
+            state = await check()
+            if until(state):
+                return state
+            await self.sleep(pace(state))
+
+
+class AsyncJobTracker(JobTracker):
+    """
+    A :py:class:`batchbeagle.aws.batch.JobTracker` that describes its chunks
+    of jobs concurrently on the event loop.
+    """
+
+    def __init__(self, manager, job_ids):
+        super().__init__(manager.batch, job_ids)
+        self.manager = manager
+
+    async def describe(self, job_ids):
+        chunks = [
+            job_ids[i:i + self.DESCRIBE_JOBS_CHUNK]
+            for i in range(0, len(job_ids), self.DESCRIBE_JOBS_CHUNK)
+        ]
+        responses = await asyncio.gather(*[
+            self.manager.call('describe_jobs', jobs=chunk) for chunk in chunks
+        ])
+        return [job for response in responses for job in response.get('jobs', [])]
+
+    async def poll(self):
+        return self._tally(await self.describe(self.active))
+
+
+class AsyncBatchManager(object):
+    """
+    Mirrors the job and resource operations of
+    :py:class:`batchbeagle.aws.batch.BatchManager` on an aiobotocore Batch
+    client, so that thousands of API calls can be in flight on one event loop.
+
+    At most ``concurrency`` calls are in flight at once; keep it no bigger
+    than the client's ``max_pool_connections``.  Throttled calls are retried
+    by botocore's own retry handler.
+
+    The queue, compute environment and job definition objects are the same
+    ones :py:class:`BatchManager` uses, but only for rendering and keeping
+    their AWS state; every AWS call is made here.
+    """
+
+    JOB_STATUSES = BatchManager.JOB_STATUSES
+    CANCELLABLE_STATUSES = BatchManager.CANCELLABLE_STATUSES
+    TERMINABLE_STATUSES = BatchManager.TERMINABLE_STATUSES
+    DESCRIBE_CHUNK = BatchManager.DESCRIBE_CHUNK
+    LIST_JOBS_PAGE_SIZE = BatchManager.LIST_JOBS_PAGE_SIZE
+
+    def __init__(self, batch, yml={}, poller=None, concurrency=50):
+        self.batch = batch
+        self.poller = poller or AsyncPoller(floor=1, ceiling=15)
+        self.concurrency = concurrency
+        # asyncio primitives are made on first use, inside the running loop:
+        # before Python 3.10 they bind to the loop current when they're made
+        self.__semaphore = None
+        self.queues = {}
+        self.compute_environments = {}
+        self.job_definitions = {}
+        self.__register_locks = {}
+        self.yml = yml
+        self.from_yaml()
+
+    def from_yaml(self):
+        for qml in self.yml.get('queues', []):
+            queue = Queue(qml)
+            self.queues[queue.name] = queue
+        for cml in self.yml.get('compute_environments', []):
+            env = ComputeEnvironment(cml, self.batch)
+            self.compute_environments[env.name] = env
+        for jml in self.yml.get('job_definitions', []):
+            jd = JobDefinition(jml, self.batch)
+            self.job_definitions[jd.name] = jd
+
+    @property
+    def semaphore(self):
+        if self.__semaphore is None:
+            self.__semaphore = asyncio.Semaphore(self.concurrency)
+        return self.__semaphore
+
+    async def call(self, operation, **kwargs):
+        """
+        Call the Batch API ``operation`` (e.g. ``'submit_job'``) once a slot is free.
+        """
+        async with self.semaphore:
+            return await getattr(self.batch, operation)(**kwargs)
+
+    async def __describe_by_name(self, operation, names_key, results_key, name_key, names):
+        async def describe_chunk(chunk):
+            results = []
+            kwargs = {names_key: chunk}
+            while True:
+                response = await self.call(operation, **kwargs)
+                results.extend(response.get(results_key, []))
+                if not response.get('nextToken'):
+                    return results
+                kwargs['nextToken'] = response['nextToken']
+
+        chunks = [names[i:i + self.DESCRIBE_CHUNK] for i in range(0, len(names), self.DESCRIBE_CHUNK)]
+        results = await asyncio.gather(*[describe_chunk(chunk) for chunk in chunks])
+        return dict((result[name_key], result) for chunk in results for result in chunk)
+
+    async def describe_queues(self, names):
+        return await self.__describe_by_name(
+            'describe_job_queues', 'jobQueues', 'jobQueues', 'jobQueueName', names
+        )
+
+    async def describe_compute_environments(self, names):
+        return await self.__describe_by_name(
+            'describe_compute_environments', 'computeEnvironments', 'computeEnvironments',
+            'computeEnvironmentName', names
+        )
+
+    async def from_aws(self):
+        """
+        Refresh our queues and compute environments from their live versions in
+        AWS.
+        """
+        env_names = set(self.compute_environments)
+        for queue in self.queues.values():
+            env_names.update(queue.compute_environments)
+        queues, envs = await asyncio.gather(
+            self.describe_queues(list(self.queues)),
+            self.describe_compute_environments(sorted(env_names))
+        )
+        for name, queue in self.queues.items():
+            queue.from_aws(queues.get(name))
+            queue.update_compute_environments(envs.values())
+        for name, env in self.compute_environments.items():
+            env.from_aws(envs.get(name))
+
+    # Job definitions
+
+    async def _active_job_definitions(self, name):
+        active = []
+        kwargs = {'jobDefinitionName': name, 'status': 'ACTIVE'}
+        while True:
+            response = await self.call('describe_job_definitions', **kwargs)
+            active.extend(response.get('jobDefinitions', []))
+            if not response.get('nextToken'):
+                return active
+            kwargs['nextToken'] = response['nextToken']
+
+    async def register_job_definition(self, name, force=False):
+        """
+        The async counterpart of
+        :py:meth:`batchbeagle.aws.batch.JobDefinition.register`.
+        """
+        jd = self.job_definitions[name]
+        if name not in self.__register_locks:
+            self.__register_locks[name] = asyncio.Lock()
+        async with self.__register_locks[name]:
+            if jd.arn and not force:
+                return
+            active = await self._active_job_definitions(name)
+            latest = jd.latest_active(active)
+            if latest and not force and jd.is_current(latest):
+                jd.arn = latest['jobDefinitionArn']
+                jd.revision = latest['revision']
+                return
+            await asyncio.gather(*[
+                self.call('deregister_job_definition', jobDefinition=definition['jobDefinitionArn'])
+                for definition in active
+            ])
+            kwargs = dict(jd.render())
+            kwargs['tags'] = {jd.HASH_TAG: jd.payload_hash()}
+            response = await self.call('register_job_definition', **kwargs)
+            jd.arn = response['jobDefinitionArn']
+            jd.revision = response['revision']
+
+    async def deregister_job_definition(self, name):
+        jd = self.job_definitions[name]
+        active = await self._active_job_definitions(name)
+        await asyncio.gather(*[
+            self.call('deregister_job_definition', jobDefinition=definition['jobDefinitionArn'])
+            for definition in active
+        ])
+        jd.arn = None
+        jd.revision = 0
+
+    # Jobs
+
+    async def submit_job(self, name, job_description, queue, parameters=None, depends_on=None,
+                         overrides=None, array_size=None):
+        await self.register_job_definition(job_description)
+        kwargs = {
+            'jobDefinition': self.job_definitions[job_description].arn,
+            'jobName': name,
+            'jobQueue': queue
+        }
+        if parameters:
+            kwargs['parameters'] = parameters
+        if depends_on:
+            kwargs['dependsOn'] = depends_on
+        if overrides:
+            kwargs['containerOverrides'] = overrides
+        if array_size:
+            kwargs['arrayProperties'] = {'size': array_size}
+        response = await self.call('submit_job', **kwargs)
+        return response['jobId']
+
+    async def submit_many(self, name, job_description, queue, rows, callback=None):
+        """
+        Submit one job per row in ``rows``, with as many submissions in flight
+        as our concurrency allows.  ``rows`` is consumed as we go, so it can
+        be a generator over a file of any size.
+
+        :rtype: :py:class:`batchbeagle.aws.batch.SubmitReport`
+        """
+        await self.register_job_definition(job_description)
+        report = SubmitReport()
+        items = enumerate(rows)
+
+        async def worker():
+            # the event loop runs one worker at a time, so they can share items
+            for index, row in items:
+                try:
+                    job_id = await self.submit_job(name, job_description, queue, parameters=row)
+                    result = SubmitResult(index, row, job_id=job_id)
+                except Exception as e:
+                    result = SubmitResult(index, row, error=e)
+                report.add(result)
+                if callback:
+                    callback(result)
+
+        await asyncio.gather(*[worker() for _ in range(self.concurrency)])
+        report.finish()
+        return report
+
+    async def _list_jobs_with_status(self, queue, status, match=None):
+        jobs = []
+        kwargs = {'jobQueue': queue, 'jobStatus': status, 'maxResults': self.LIST_JOBS_PAGE_SIZE}
+        while True:
+            response = await self.call('list_jobs', **kwargs)
+            joblist = response.get('jobSummaryList', [])
+            if match:
+                joblist = [job for job in joblist if match(job)]
+            jobs.extend(job['jobId'] for job in joblist)
+            if not response.get('nextToken'):
+                return jobs
+            kwargs['nextToken'] = response['nextToken']
+
+    async def get_jobs(self, queue, statuses=None, match=None):
+        """
+        :rtype: 2-tuple: (list of job ids, dict of status to job count)
+        """
+        if statuses is None:
+            statuses = self.JOB_STATUSES
+        results = await asyncio.gather(*[
+            self._list_jobs_with_status(queue, status, match) for status in statuses
+        ])
+        counts = dict((status, len(jobs)) for status, jobs in zip(statuses, results))
+        return list(itertools.chain.from_iterable(results)), counts
+
+    async def count_jobs(self, queue, **filters):
+        return (await self.get_jobs(queue, match=BatchManager._job_filter(**filters)))[1]
+
+    def track_jobs(self, job_ids):
+        return AsyncJobTracker(self, job_ids)
+
+    async def wait_for_jobs(self, job_ids):
+        """
+        Wait until every job in ``job_ids`` has finished.
+
+        :rtype: dict of job status to the number of jobs with that status
+        """
+        tracker = self.track_jobs(job_ids)
+        return await self.poller.wait(tracker.poll, lambda statuses: not tracker.active)
+
+    async def _act_on_all_jobs(self, operation, statuses, queue, reason, **filters):
+        jobs, counts = await self.get_jobs(queue, statuses=statuses, match=BatchManager._job_filter(**filters))
+
+        async def act(job_id):
+            try:
+                await self.call(operation, jobId=job_id, reason=reason)
+            except Exception as e:
+                return job_id, e
+
+        failures = await asyncio.gather(*[act(job_id) for job_id in jobs])
+        return len(jobs), [failure for failure in failures if failure]
+
+    async def cancel_all_jobs(self, queue, **filters):
+        return await self._act_on_all_jobs(
+            'cancel_job', self.CANCELLABLE_STATUSES, queue, "Cancelling all jobs.", **filters
+        )
+
+    async def terminate_all_jobs(self, queue, **filters):
+        return await self._act_on_all_jobs(
+            'terminate_job', self.TERMINABLE_STATUSES, queue, "Terminating all jobs.", **filters
+        )
+
+    async def stop_all_jobs(self, queue, **filters):
+        # cancel before terminating, so that jobs which start while we cancel
+        # are still caught by the terminate pass
+        cancelled, cancel_failures = await self.cancel_all_jobs(queue, **filters)
+        terminated, terminate_failures = await self.terminate_all_jobs(queue, **filters)
+        return cancelled + terminated, cancel_failures + terminate_failures
+
+    # Assemble and teardown
+
+    async def wait_until_valid(self, compute_environment):
+        """
+        Wait for ``compute_environment`` to become VALID.
+
+        :rtype: the compute environment's description dict
+        """
+        async def describe():
+            return (await self.describe_compute_environments([compute_environment])).get(compute_environment, {})
+
+        env = await self.poller.wait(describe, lambda env: env.get('status') in ('VALID', 'INVALID'))
+        if env['status'] == 'INVALID':
+            raise ResourceError("Compute environment {} is INVALID: {}".format(
+                compute_environment, env.get('statusReason', '')
+            ))
+        return env
+
+    async def __assemble_compute_environment(self, compute_environment):
+        c = self.compute_environments[compute_environment]
+        if not c.exists():
+            await self.call('create_compute_environment', **c.render())
+        elif BatchManager._compute_environment_plan(c).action:
+            await self.call('update_compute_environment', **c.render(True))
+        return await self.wait_until_valid(compute_environment)
+
+    async def __assemble_queue(self, queue, env_tasks):
+        q = self.queues[queue]
+        envs = await asyncio.gather(*[
+            env_tasks[name] if name in env_tasks else self.wait_until_valid(name)
+            for name in q.compute_environments
+        ])
+        q.update_compute_environments(envs)
+        if not q.exists():
+            await self.call('create_job_queue', **q.render())
+        elif BatchManager._queue_plan(q).action:
+            await self.call('update_job_queue', **q.render(True))
+
+    async def assemble(self):
+        """
+        Create or update everything in our config, along the same dependency
+        graph as :py:meth:`batchbeagle.aws.batch.BatchManager.assemble`.
+        """
+        await self.from_aws()
+        env_tasks = dict(
+            (name, asyncio.ensure_future(self.__assemble_compute_environment(name)))
+            for name in self.compute_environments
+        )
+        await asyncio.gather(
+            *[self.register_job_definition(name) for name in self.job_definitions],
+            *[self.__assemble_queue(queue, env_tasks) for queue in self.queues],
+            *env_tasks.values()
+        )
+
+    async def __retire(self, kind, name, describe, disable, destroy):
+        started = time.time()
+        state = await describe()
+        if state and state['state'] != 'DISABLED':
+            await disable()
+        state = await self.poller.wait(
+            describe,
+            lambda state: not state or (state['state'] == 'DISABLED' and state['status'] != 'UPDATING')
+        )
+        print("{} {}: disabled after {:.1f}s".format(kind, name, time.time() - started))
+        if state and state['status'] not in ('DELETED', 'DELETING'):
+            await destroy()
+        await self.poller.wait(describe, lambda state: not state or state['status'] == 'DELETED')
+        print("{} {}: deleted after {:.1f}s".format(kind, name, time.time() - started))
+
+    async def __teardown_queue(self, queue):
+        q = self.queues[queue]
+        if not q.exists():
+            return
+        await self.stop_all_jobs(queue)
+
+        async def describe():
+            return (await self.describe_queues([queue])).get(queue, {})
+
+        async def disable():
+            kwargs = q.render(True)
+            kwargs['state'] = 'DISABLED'
+            await self.call('update_job_queue', **kwargs)
+
+        await self.__retire(
+            'Queue', queue, describe, disable, lambda: self.call('delete_job_queue', jobQueue=queue)
+        )
+        q.from_aws(None)
+
+    async def __teardown_compute_environment(self, compute_environment, queue_tasks):
+        # Wait for every queue that uses us to be deleted first
+        await asyncio.gather(*[
+            task for queue, task in queue_tasks.items()
+            if compute_environment in self.queues[queue].compute_environments
+        ])
+        c = self.compute_environments[compute_environment]
+        if not c.exists():
+            return
+
+        async def describe():
+            return (await self.describe_compute_environments([compute_environment])).get(compute_environment, {})
+
+        async def disable():
+            kwargs = c.render(True)
+            kwargs['state'] = 'DISABLED'
+            await self.call('update_compute_environment', **kwargs)
+
+        await self.__retire(
+            'Compute environment', compute_environment, describe, disable,
+            lambda: self.call('delete_compute_environment', computeEnvironment=compute_environment)
+        )
+        c.from_aws(None)
+
+    async def teardown(self):
+        """
+        Tear down everything in our config, along the same dependency graph
+        as :py:meth:`batchbeagle.aws.batch.BatchManager.teardown`.
+        """
+        await self.from_aws()
+        queue_tasks = dict(
+            (queue, asyncio.ensure_future(self.__teardown_queue(queue)))
+            for queue in self.queues
+        )
+        await asyncio.gather(
+            *[self.deregister_job_definition(name) for name in self.job_definitions],
+            *[self.__teardown_compute_environment(name, queue_tasks) for name in self.compute_environments],
+            *queue_tasks.values()
+        )
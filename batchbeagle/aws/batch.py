@@ -1,9 +1,29 @@
 from __future__ import print_function
 
-import boto3
+import hashlib
+import json
+import threading
 import time
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+
+try:
+    from queue import Queue as ResultQueue
+except ImportError:
+    from Queue import Queue as ResultQueue
+
 import yaml
 
+from batchbeagle.aws.client import make_batch_client
+from batchbeagle.aws.plan import Plan, ResourcePlan, diff
+from batchbeagle.aws.throttle import AdaptiveRateLimiter
+from batchbeagle.manifest import MANIFEST_ENV, MANIFEST_OFFSET_ENV, write_manifest
+from batchbeagle.poll import Poller
+
+class ResourceError(Exception):
+    pass
+
+
 class AWSRenderable(object):
 
     def __init__(self, limited_update=False):
@@ -224,9 +244,13 @@ class JobContainer(AWSRenderable):
 
 class JobDefinition(AWSRenderable):
 
-    def __init__(self, yml={}):
+    # tag holding the payload hash of the configuration a revision was registered from
+    HASH_TAG = 'batchbeagle:hash'
+
+    def __init__(self, yml={}, batch=None):
         super(JobDefinition, self).__init__()
-        self.batch = boto3.client('batch')
+        self.batch = batch or make_batch_client()
+        self._register_lock = threading.Lock()
         self.from_yaml(yml)
         self.__aws_j = None
         self.arn = None
@@ -247,7 +271,7 @@ class JobDefinition(AWSRenderable):
         self._add_key('retryStrategy')
         self._add_key('timeout')
 
-    def _get_all_active(self):
+    def _get_all_active_definitions(self):
         active = []
         nextToken = ''
         while True:
@@ -257,26 +281,73 @@ class JobDefinition(AWSRenderable):
                 nextToken = nextToken
             )
             if 'jobDefinitions' in response and response['jobDefinitions']:
-                for jd in response['jobDefinitions']:
-                    arn = jd['jobDefinitionArn']
-                    active.append(arn)
+                active.extend(response['jobDefinitions'])
             nextToken = response.get('nextToken', None)
             if not nextToken:
                 break
         return active
 
+    def _get_all_active(self):
+        return [jd['jobDefinitionArn'] for jd in self._get_all_active_definitions()]
 
-    def deregister(self):
-        active = self._get_all_active()
+    def payload_hash(self):
+        """
+        Return a canonical hash of our ``render()`` payload.  We tag every
+        revision we register with this so we can tell whether the latest ACTIVE
+        revision in AWS already matches our configuration.
+        """
+        payload = json.dumps(self.render(), sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def deregister(self, active=None):
+        if active is None:
+            active = self._get_all_active()
         for jd in active:
             response = self.batch.deregister_job_definition(jobDefinition=jd)
+        self.arn = None
+        self.revision = 0
 
-    def register(self):
-        self.deregister()
-        kwargs = self.render()
-        response = self.batch.register_job_definition(**kwargs)
-        self.arn = response['jobDefinitionArn']
-        self.revision = response['revision']
+    def latest_active(self, active=None):
+        """
+        :rtype: the description dict of our latest ACTIVE revision, or ``None``
+        """
+        if active is None:
+            active = self._get_all_active_definitions()
+        if active:
+            return max(active, key=lambda jd: jd['revision'])
+        return None
+
+    def is_current(self, definition):
+        """
+        Return ``True`` if the revision described by ``definition`` was
+        registered from exactly our current configuration.
+        """
+        return definition.get('tags', {}).get(self.HASH_TAG) == self.payload_hash()
+
+    def register(self, force=False):
+        """
+        Make sure an ACTIVE revision matching our configuration exists, and set
+        ``self.arn`` and ``self.revision`` to it.
+
+        If the latest ACTIVE revision carries our payload hash we reuse it,
+        otherwise we deregister the old revisions and register a new one.  Once
+        we have an ARN, further calls are no-ops unless ``force`` is ``True``.
+        """
+        with self._register_lock:
+            if self.arn and not force:
+                return
+            active = self._get_all_active_definitions()
+            latest = self.latest_active(active)
+            if latest and not force and self.is_current(latest):
+                self.arn = latest['jobDefinitionArn']
+                self.revision = latest['revision']
+                return
+            self.deregister([jd['jobDefinitionArn'] for jd in active])
+            kwargs = dict(self.render())
+            kwargs['tags'] = {self.HASH_TAG: self.payload_hash()}
+            response = self.batch.register_job_definition(**kwargs)
+            self.arn = response['jobDefinitionArn']
+            self.revision = response['revision']
 
     def __getattr__(self, attr):
         """
@@ -331,9 +402,9 @@ class JobDefinition(AWSRenderable):
 
 class ComputeResources(AWSLimitedUpdateRenderable):
 
-    def __init__(self, yml={}):
+    def __init__(self, yml={}, batch=None):
         super(ComputeResources, self).__init__()
-        self.batch = boto3.client('batch')
+        self.batch = batch
         if yml:
             self.from_yaml(yml)
 
@@ -410,9 +481,9 @@ class ComputeEnvironment(AWSLimitedUpdateRenderable):
 
     MANAGED = 'MANAGED'
 
-    def __init__(self, yml={}):
+    def __init__(self, yml={}, batch=None):
         super(ComputeEnvironment, self).__init__()
-        self.batch = boto3.client('batch')
+        self.batch = batch or make_batch_client()
         self.from_yaml(yml)
         self.order = 0
 
@@ -454,7 +525,7 @@ class ComputeEnvironment(AWSLimitedUpdateRenderable):
             self.state = 'ENABLED'
         self.serviceRole = yml['serviceRole']
         if self.type == self.MANAGED:
-            self.compute_resources = ComputeResources(yml['compute_resources'])
+            self.compute_resources = ComputeResources(yml['compute_resources'], self.batch)
         else:
             self.compute_resources = None
         self.__aws_compute_environment = None
@@ -475,6 +546,9 @@ class ComputeEnvironment(AWSLimitedUpdateRenderable):
         if self.exists():
             return self.__aws_compute_environment['state']
 
+    def aws_description(self):
+        return self.__aws_compute_environment
+
     def exists(self):
         if self.__aws_compute_environment:
             return True
@@ -609,6 +683,9 @@ class Queue(AWSLimitedUpdateRenderable):
         if self.exists():
             return self.__aws_queue['state']
 
+    def aws_description(self):
+        return self.__aws_queue
+
     def update_compute_environments(self, aws_compute_environments):
         for env in aws_compute_environments:
             for name, env_order in self.compute_environments.items():
@@ -641,16 +718,302 @@ class Queue(AWSLimitedUpdateRenderable):
         return description
 
 
+class SubmitResult(object):
+    """
+    The outcome of submitting one row of a parameters file.
+    """
+
+    def __init__(self, index, row, job_id=None, error=None):
+        self.index = index
+        self.row = row
+        self.job_id = job_id
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class SubmitReport(object):
+    """
+    Collects the ``SubmitResult`` objects of a ``BatchManager.submit_many()``
+    run.  We keep the job ids of successful rows, but the full result only for
+    rows that failed.
+    """
+
+    def __init__(self):
+        self.job_ids = []
+        self.failures = []
+        self.started = time.time()
+        self.finished = None
+
+    def add(self, result):
+        if result.ok:
+            self.job_ids.append(result.job_id)
+        else:
+            self.failures.append(result)
+
+    def finish(self):
+        self.finished = time.time()
+
+    @property
+    def succeeded(self):
+        return len(self.job_ids)
+
+    @property
+    def failed(self):
+        return len(self.failures)
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def rate(self):
+        if self.elapsed > 0:
+            return self.succeeded / self.elapsed
+        return 0.0
+
+    def describe(self):
+        lines = ["Submitted {} jobs ({} failed) in {:.1f}s: {:.1f} jobs/s".format(
+            self.succeeded, self.failed, self.elapsed, self.rate
+        )]
+        for result in self.failures:
+            lines.append("  row {}: {}".format(result.index, result.error))
+        return lines
+
+
+class JobTracker(object):
+    """
+    Follows a known set of jobs through ``describe_jobs()`` instead of
+    listing whole queues.
+
+    Each ``poll()`` describes the unfinished jobs in chunks of
+    ``DESCRIBE_JOBS_CHUNK``, one chunk per worker thread.  Jobs that reach
+    SUCCEEDED or FAILED are counted once and dropped from the working set, so
+    polls get cheaper as the run drains.  Array jobs are counted by their
+    children.
+
+    A job that ``describe_jobs()`` doesn't return is counted as SUBMITTED
+    while it may only just have been submitted.  Once it has been missing for
+    ``MISSING_POLLS`` polls or ``MISSING_SECONDS`` seconds, whichever comes
+    first, it is counted as MISSING and dropped from the working set: AWS
+    forgets jobs some time after they finish, so an old job id may never be
+    found again.
+    """
+
+    # the most job ids describe_jobs() accepts per call
+    DESCRIBE_JOBS_CHUNK = 100
+    FINISHED = ('SUCCEEDED', 'FAILED')
+    MISSING_POLLS = 10
+    MISSING_SECONDS = 60
+
+    def __init__(self, batch, job_ids, workers=8):
+        self.batch = batch
+        self.workers = workers
+        self.active = list(job_ids)
+        self.finished = dict((status, 0) for status in self.FINISHED)
+        self.finished['MISSING'] = 0
+        # job id to (polls missed, time first missed)
+        self.missing = {}
+
+    def _describe(self, chunk):
+        return self.batch.describe_jobs(jobs=chunk).get('jobs', [])
+
+    def describe(self, job_ids):
+        """
+        :rtype: list of ``describe_jobs()`` job dicts for those of ``job_ids``
+                that AWS knows about
+        """
+        chunks = [
+            job_ids[i:i + self.DESCRIBE_JOBS_CHUNK]
+            for i in range(0, len(job_ids), self.DESCRIBE_JOBS_CHUNK)
+        ]
+        if not chunks:
+            return []
+        pool = ThreadPool(min(self.workers, len(chunks)))
+        try:
+            results = pool.map(self._describe, chunks)
+        finally:
+            pool.close()
+            pool.join()
+        return [job for jobs in results for job in jobs]
+
+    def _job_counts(self, job):
+        summary = job.get('arrayProperties', {}).get('statusSummary')
+        if summary:
+            return summary
+        return {job['status']: 1}
+
+    def poll(self):
+        """
+        :rtype: dict of job status to the number of tracked jobs with that status
+        """
+        return self._tally(self.describe(self.active))
+
+    def _tally(self, jobs):
+        """
+        Count ``jobs``, the descriptions of our active jobs, by status, and
+        drop the finished ones from the working set.
+        """
+        statuses = dict((status, 0) for status in BatchManager.JOB_STATUSES)
+        statuses.update(self.finished)
+        described = set()
+        finished = set()
+        for job in jobs:
+            described.add(job['jobId'])
+            counts = self._job_counts(job)
+            for status, count in counts.items():
+                statuses[status] = statuses.get(status, 0) + count
+            if job['status'] in self.FINISHED:
+                finished.add(job['jobId'])
+                for status in self.FINISHED:
+                    self.finished[status] += counts.get(status, 0)
+        # Jobs that describe_jobs() doesn't know about may only just have
+        # been submitted; keep them in the working set for a while
+        now = time.time()
+        for job_id in self.active:
+            if job_id in described:
+                self.missing.pop(job_id, None)
+                continue
+            polls, since = self.missing.get(job_id, (0, now))
+            polls += 1
+            if polls >= self.MISSING_POLLS or now - since >= self.MISSING_SECONDS:
+                self.missing.pop(job_id, None)
+                finished.add(job_id)
+                self.finished['MISSING'] += 1
+                statuses['MISSING'] += 1
+            else:
+                self.missing[job_id] = (polls, since)
+                statuses['SUBMITTED'] += 1
+        self.active = [job_id for job_id in self.active if job_id not in finished]
+        return statuses
+
+
+class JobEvent(object):
+    """
+    One job moving from ``old_status`` to ``new_status``.  ``old_status`` is
+    ``None`` the first time we see a job.  The AWS timestamps are in
+    milliseconds since the epoch and ``None`` until they happen;
+    ``observed_at`` is when we noticed the change, in seconds.
+    """
+
+    FIELDS = ('job_id', 'job_name', 'old_status', 'new_status', 'status_reason',
+              'created_at', 'started_at', 'stopped_at', 'observed_at')
+
+    def __init__(self, job, old_status, observed_at):
+        self.job_id = job['jobId']
+        self.job_name = job.get('jobName')
+        self.old_status = old_status
+        self.new_status = job['status']
+        self.status_reason = job.get('statusReason')
+        self.created_at = job.get('createdAt')
+        self.started_at = job.get('startedAt')
+        self.stopped_at = job.get('stoppedAt')
+        self.observed_at = observed_at
+
+    def as_dict(self):
+        return dict((field, getattr(self, field)) for field in self.FIELDS)
+
+    def describe(self):
+        line = "{} {}: {} -> {}".format(self.job_id, self.job_name, self.old_status, self.new_status)
+        if self.status_reason:
+            line += " ({})".format(self.status_reason)
+        return line
+
+
+class JobWatcher(JobTracker):
+    """
+    Turns successive looks at a set of jobs into :py:class:`JobEvent` objects
+    by comparing each look with the one before it.
+
+    With ``job_ids``, we describe just those jobs, dropping them once they
+    finish.  With ``queue``, we list the queue's unfinished jobs, and only
+    describe the ones that dropped off those lists to find out how they
+    ended.  A job that is submitted and finishes between two looks at a queue
+    is never seen.
+    """
+
+    def __init__(self, manager, queue=None, job_ids=None, workers=8):
+        super(JobWatcher, self).__init__(manager.batch, job_ids or [], workers=workers)
+        self.manager = manager
+        self.queue = queue
+        self.statuses = {}
+
+    @property
+    def done(self):
+        """
+        ``True`` once nothing we are watching is unfinished.
+        """
+        if self.queue:
+            return not any(status not in self.FINISHED for status in self.statuses.values())
+        return not self.active
+
+    def _look(self):
+        if not self.queue:
+            return self.describe(self.active)
+        unfinished = [status for status in BatchManager.JOB_STATUSES if status not in self.FINISHED]
+        jobs = self.manager.list_job_summaries(self.queue, unfinished)
+        listed = set(job['jobId'] for job in jobs)
+        vanished = [
+            job_id for job_id, status in self.statuses.items()
+            if job_id not in listed and status not in self.FINISHED
+        ]
+        return jobs + self.describe(vanished)
+
+    def poll(self):
+        """
+        :rtype: list of the :py:class:`JobEvent` objects for every job whose
+                status changed since the last ``poll()``
+        """
+        events = []
+        now = time.time()
+        for job in self._look():
+            old_status = self.statuses.get(job['jobId'])
+            if job['status'] != old_status:
+                events.append(JobEvent(job, old_status, now))
+            self.statuses[job['jobId']] = job['status']
+        if not self.queue:
+            self.active = [job_id for job_id in self.active if self.statuses.get(job_id) not in self.FINISHED]
+        else:
+            # forget finished jobs, or they would be described again forever
+            for job_id, status in list(self.statuses.items()):
+                if status in self.FINISHED:
+                    del self.statuses[job_id]
+        return events
+
+
 class BatchManager(object):
 
-    def __init__(self, yml={}):
-        self.batch = boto3.client('batch')
+    # AWS Batch caps an array job at this many child jobs
+    ARRAY_SIZE_LIMIT = 10000
+    # submit_many() keeps up to this many rows per worker thread in flight
+    SUBMIT_AHEAD = 2
+    JOB_STATUSES = ('SUBMITTED', 'PENDING', 'RUNNABLE', 'STARTING', 'RUNNING', 'SUCCEEDED', 'FAILED')
+    # the statuses in which cancel_job() and terminate_job() have an effect
+    CANCELLABLE_STATUSES = ('SUBMITTED', 'PENDING', 'RUNNABLE')
+    TERMINABLE_STATUSES = ('STARTING', 'RUNNING')
+    # describe_job_queues() and describe_compute_environments() take at most
+    # this many names per call
+    DESCRIBE_CHUNK = 100
+    DESCRIBE_WORKERS = 8
+    # the most resources of each kind assemble() works on at once
+    ASSEMBLE_WORKERS = 16
+    # the largest page ListJobs will return when filtering by status
+    LIST_JOBS_PAGE_SIZE = 1000
+
+    def __init__(self, yml={}, poller=None, batch=None):
+        # One client, shared by every resource object we build
+        self.batch = batch or make_batch_client()
+        self.poller = poller or Poller(floor=1, ceiling=15)
         self.queues = {}
         self.compute_environments = {}
         self.job_definitions = {}
         self.yml = yml
         self.from_yaml()
-        self.from_aws()
+        # AWS state is fetched by load_aws() on first use, not here
+        self.__aws_loaded = False
+        self.__aws_frozen = False
 
     def from_yaml(self):
         if 'queues' in self.yml:
@@ -660,48 +1023,134 @@ class BatchManager(object):
 
         if 'compute_environments' in self.yml:
             for cml in self.yml['compute_environments']:
-                env = ComputeEnvironment(cml)
+                env = ComputeEnvironment(cml, self.batch)
                 self.compute_environments[env.name] = env
 
         if 'job_definitions' in self.yml:
             for jml in self.yml['job_definitions']:
-                jd = JobDefinition(jml)
+                jd = JobDefinition(jml, self.batch)
                 self.job_definitions[jd.name] = jd
 
+    def __describe_by_name(self, describe, names_key, results_key, name_key, names):
+        """
+        Describe the resources called ``names`` with ``describe``, in chunks of
+        ``DESCRIBE_CHUNK`` names issued concurrently, following ``nextToken``
+        within each chunk.
+
+        :rtype: dict of resource name to the description dict AWS returned
+        """
+        chunks = [names[i:i + self.DESCRIBE_CHUNK] for i in range(0, len(names), self.DESCRIBE_CHUNK)]
+
+        def describe_chunk(chunk):
+            results = []
+            kwargs = {names_key: chunk}
+            while True:
+                response = describe(**kwargs)
+                results.extend(response.get(results_key, []))
+                if not response.get('nextToken', None):
+                    break
+                kwargs['nextToken'] = response['nextToken']
+            return results
+
+        # With no names at all, AWS would describe every resource in the account
+        if not chunks:
+            return {}
+        if len(chunks) == 1:
+            results = [describe_chunk(chunks[0])]
+        else:
+            pool = ThreadPool(min(self.DESCRIBE_WORKERS, len(chunks)))
+            try:
+                results = pool.map(describe_chunk, chunks)
+            finally:
+                pool.close()
+                pool.join()
+        described = {}
+        for chunk_results in results:
+            for result in chunk_results:
+                described[result[name_key]] = result
+        return described
+
+    def __describe_queues(self, names):
+        return self.__describe_by_name(
+            self.batch.describe_job_queues,
+            'jobQueues',
+            'jobQueues',
+            'jobQueueName',
+            names
+        )
+
     def __get_queues(self):
-        response = self.batch.describe_job_queues(
-            jobQueues=list(self.queues)
+        return list(self.__describe_queues(list(self.queues)).values())
+
+    def __describe_compute_environments(self, names):
+        return self.__describe_by_name(
+            self.batch.describe_compute_environments,
+            'computeEnvironments',
+            'computeEnvironments',
+            'computeEnvironmentName',
+            names
         )
-        if 'jobQueues' in response and response['jobQueues']:
-            return response['jobQueues']
-        else:
-            return {}
 
     def __get_compute_environments(self):
         compute_environments = list(self.compute_environments)
         for name, queue in self.queues.items():
             for env in queue.compute_environments.values():
-                if env.name not in self.compute_environments:
+                if env.name not in self.compute_environments and env.name not in compute_environments:
                     compute_environments.append(env.name)
 
-        response = self.batch.describe_compute_environments(
-            computeEnvironments=compute_environments
-        )
-        if 'computeEnvironments' in response and response['computeEnvironments']:
-            return response['computeEnvironments']
-        else:
-            return {}
+        return list(self.__describe_compute_environments(compute_environments).values())
 
     def from_aws(self):
+        """
+        Refresh our queues and compute environments from their live versions in
+        AWS.
+        """
+        for queue in self.queues.values():
+            queue.from_aws(None)
+        for env in self.compute_environments.values():
+            env.from_aws(None)
         aws_queues = self.__get_queues()
         for queue in aws_queues:
             self.queues[queue['jobQueueName']].from_aws(queue)
         aws_compute_environments = self.__get_compute_environments()
         for env in aws_compute_environments:
-            self.compute_environments[env['computeEnvironmentName']].from_aws(env)
+            # queues may name compute environments that aren't in our config
+            if env['computeEnvironmentName'] in self.compute_environments:
+                self.compute_environments[env['computeEnvironmentName']].from_aws(env)
 
         for queue in self.queues.values():
             queue.update_compute_environments(aws_compute_environments)
+        self.__aws_loaded = True
+
+    def load_aws(self):
+        """
+        Load our AWS state if we haven't yet, or if it was invalidated since.
+        """
+        if not self.__aws_loaded and not self.__aws_frozen:
+            self.from_aws()
+
+    def invalidate_aws(self):
+        """
+        Forget our AWS state, so that the next ``load_aws()`` fetches it again.
+        Call this after changing anything in AWS.
+        """
+        self.__aws_loaded = False
+
+    @contextmanager
+    def _frozen_aws(self):
+        """
+        Within this block, ``load_aws()`` keeps using the state we have, even
+        after mutations; explicit ``from_aws()`` calls still refresh it.  This
+        lets loops of mutations avoid re-describing everything on every step.
+        The state is invalidated on the way out.
+        """
+        self.load_aws()
+        self.__aws_frozen = True
+        try:
+            yield
+        finally:
+            self.__aws_frozen = False
+            self.invalidate_aws()
 
     def create_job_definition(self, name):
         self.job_definitions[name].register()
@@ -715,7 +1164,7 @@ class BatchManager(object):
         self.job_definitions[name].deregister()
         # self.describe()
 
-    def submit_job(self, name, job_description, queue, parameters={}, depends_on=[], overrides={}, retries=0):
+    def submit_job(self, name, job_description, queue, parameters={}, depends_on=[], overrides={}, retries=0, array_size=None):
         jd = self.job_definitions[job_description]
         jd.register()
         kwargs = {
@@ -725,37 +1174,251 @@ class BatchManager(object):
         }
         if parameters:
             kwargs['parameters'] = parameters
+        if depends_on:
+            kwargs['dependsOn'] = depends_on
+        if overrides:
+            kwargs['containerOverrides'] = overrides
+        if array_size:
+            kwargs['arrayProperties'] = {'size': array_size}
         response = self.batch.submit_job(**kwargs)
+        return response['jobId']
+
+    def submit_array_jobs(self, name, job_description, queue, rows, manifest):
+        """
+        Submit ``rows`` as AWS Batch array jobs instead of one job per row.
+
+        Every row is written to the parameter manifest at ``manifest`` (a local
+        path or an ``s3://bucket/key`` URI), then one array job is submitted per
+        ``ARRAY_SIZE_LIMIT`` rows.  Each child finds its row at
+        ``BEAGLE_MANIFEST_OFFSET + AWS_BATCH_JOB_ARRAY_INDEX``; see
+        :py:mod:`batchbeagle.manifest`.
+
+        :param rows: an iterable of parameter dicts
+        :param manifest: where to write the parameter manifest
+
+        :rtype: list of job ids
+        """
+        count = write_manifest(rows, manifest)
+        job_ids = []
+        for offset in range(0, count, self.ARRAY_SIZE_LIMIT):
+            size = min(self.ARRAY_SIZE_LIMIT, count - offset)
+            overrides = {
+                'environment': [
+                    {'name': MANIFEST_ENV, 'value': manifest},
+                    {'name': MANIFEST_OFFSET_ENV, 'value': str(offset)},
+                ]
+            }
+            # Array jobs need at least two children, so a lone trailing row
+            # becomes a plain job that still resolves through the manifest.
+            job_ids.append(self.submit_job(
+                name,
+                job_description,
+                queue,
+                overrides=overrides,
+                array_size=size if size > 1 else None
+            ))
+        return job_ids
+
+    def submit_many(self, name, job_description, queue, rows, workers=1, limiter=None, callback=None):
+        """
+        Submit one job per row in ``rows`` from a pool of ``workers`` threads.
+
+        All workers draw from one :py:class:`AdaptiveRateLimiter`, which backs
+        off when AWS throttles us and ramps back up afterwards.  ``callback``,
+        if given, is called in the calling thread with each ``SubmitResult`` as
+        it completes, in completion order.
+
+        If reading ``rows`` or ``callback`` raises, or we are interrupted, we
+        stop handing out rows, but wait for the ones already handed out and
+        pass their results to ``callback`` before re-raising, so that every
+        job we submitted is reported.
 
-    def get_jobs(self, queue):
+        :rtype: SubmitReport
+        """
+        if limiter is None:
+            limiter = AdaptiveRateLimiter()
+        # Register once up front rather than having every worker wait on it
+        self.job_definitions[job_description].register()
+        report = SubmitReport()
+
+        def submit_row(item):
+            index, row = item
+            try:
+                job_id = limiter.call(self.submit_job, name, job_description, queue, parameters=row)
+            except Exception as e:
+                return SubmitResult(index, row, error=e)
+            return SubmitResult(index, row, job_id=job_id)
+
+        results = ResultQueue()
+        in_flight = {'count': 0}
+
+        def collect():
+            result = results.get()
+            in_flight['count'] -= 1
+            report.add(result)
+            if callback:
+                callback(result)
+
+        pool = ThreadPool(workers)
+        try:
+            try:
+                # Only a few rows per worker are handed out at a time, so we
+                # never hold the whole parameters file in memory
+                for item in enumerate(rows):
+                    while in_flight['count'] >= workers * self.SUBMIT_AHEAD:
+                        collect()
+                    pool.apply_async(submit_row, (item,), callback=results.put)
+                    in_flight['count'] += 1
+                while in_flight['count']:
+                    collect()
+            except BaseException:
+                while in_flight['count']:
+                    collect()
+                raise
+        finally:
+            pool.close()
+            pool.join()
+        report.finish()
+        return report
+
+    def submit_workflow(self, name, workflow, queue, workers=8):
+        """
+        Submit every step of ``workflow`` as its own job, wired together with
+        ``dependsOn`` so that AWS Batch runs the whole pipeline without us
+        having to wait between steps.
+
+        Steps are submitted a level at a time (see
+        :py:meth:`batchbeagle.workflow.Workflow.levels`), each level from up
+        to ``workers`` threads, since a step can only name the job ids of the
+        steps it depends on once those have been submitted.  Each job is named
+        ``<name>-<step id>``.
+
+        :param workflow: a :py:class:`batchbeagle.workflow.Workflow`
+        :param queue: the queue for steps that don't name their own
+
+        :rtype: dict of step id to job id
+        """
+        levels = workflow.levels()
+        # Register every job definition once up front rather than having
+        # every worker wait on it
+        for job_definition in set(step.job_definition for level in levels for step in level):
+            self.job_definitions[job_definition].register()
+        job_ids = {}
+
+        def submit_step(step):
+            return step.id, self.submit_job(
+                "{}-{}".format(name, step.id),
+                step.job_definition,
+                step.queue or queue,
+                parameters=step.parameters,
+                depends_on=step.render_depends_on(job_ids),
+                array_size=step.array_size
+            )
+
+        pool = ThreadPool(workers)
+        try:
+            for level in levels:
+                job_ids.update(pool.map(submit_step, level))
+        finally:
+            pool.close()
+            pool.join()
+        return job_ids
+
+    def _iter_job_summary_pages(self, queue, status):
+        nextToken = ''
+        while True:
+            response = self.batch.list_jobs(
+                jobQueue=queue,
+                jobStatus=status,
+                maxResults=self.LIST_JOBS_PAGE_SIZE,
+                nextToken=nextToken
+            )
+            yield response.get('jobSummaryList', [])
+            nextToken = response.get('nextToken', None)
+            if not nextToken:
+                break
+
+    def _list_jobs_with_status(self, queue, status, ids=True, match=None):
         jobs = []
-        statuses = {
-            'SUBMITTED': 0,
-            'PENDING': 0,
-            'RUNNABLE': 0,
-            'STARTING': 0,
-            'RUNNING': 0,
-            'SUCCEEDED': 0,
-            'FAILED': 0
-        }
+        count = 0
+        for joblist in self._iter_job_summary_pages(queue, status):
+            if match:
+                joblist = [job for job in joblist if match(job)]
+            count += len(joblist)
+            if ids:
+                jobs.extend(job['jobId'] for job in joblist)
+        return jobs, count
+
+    def list_job_summaries(self, queue, statuses=None):
+        """
+        Like ``get_jobs()``, but return the whole ``list_jobs()`` job summary
+        dict of every job, each with its ``status`` filled in.
+        """
+        if statuses is None:
+            statuses = self.JOB_STATUSES
+
+        def list_status(status):
+            jobs = []
+            for joblist in self._iter_job_summary_pages(queue, status):
+                for job in joblist:
+                    job.setdefault('status', status)
+                    jobs.append(job)
+            return jobs
+
+        pool = ThreadPool(len(statuses))
+        try:
+            results = pool.map(list_status, statuses)
+        finally:
+            pool.close()
+            pool.join()
+        return [job for jobs in results for job in jobs]
 
-        for status in statuses.keys():
-            nextToken = ''
-            while True:
-                response = self.batch.list_jobs(jobQueue=queue, jobStatus=status, nextToken=nextToken)
-                if 'jobSummaryList' in response:
-                    joblist = response['jobSummaryList']
-                    for job in joblist:
-                        jobs.append(job['jobId'])
-                        statuses[status] += 1
-                nextToken = response.get('nextToken', None)
-                if not nextToken:
-                    break
+    def get_jobs(self, queue, ids=True, statuses=None, match=None):
+        """
+        Scan ``queue`` for jobs in each of ``statuses`` (all of
+        ``JOB_STATUSES`` by default), one thread per status.
+
+        :param ids: if ``False``, only count the jobs and return an empty list
+                    of job ids
+        :param match: if given, only include jobs whose ``list_jobs()`` job
+                      summary dict makes this return ``True``
+
+        :rtype: 2-tuple: (list of job ids, dict of status to job count)
+        """
+        if statuses is None:
+            statuses = self.JOB_STATUSES
+        pool = ThreadPool(len(statuses))
+        try:
+            results = pool.map(lambda status: self._list_jobs_with_status(queue, status, ids, match), statuses)
+        finally:
+            pool.close()
+            pool.join()
+        jobs = []
+        counts = {}
+        for status, (status_jobs, count) in zip(statuses, results):
+            jobs.extend(status_jobs)
+            counts[status] = count
+        return jobs, counts
 
-        return jobs, statuses
+    def count_jobs(self, queue, **filters):
+        """
+        Accepts the ``name_prefix``, ``created_after`` and ``created_before``
+        filters of ``_job_filter()``.
+
+        :rtype: dict of status to the number of jobs in ``queue`` with that status
+        """
+        return self.get_jobs(queue, ids=False, match=self._job_filter(**filters))[1]
 
     def list_jobs(self, queue):
-        jobs, statuses = self.get_jobs(queue)
+        return self.format_job_counts(self.count_jobs(queue))
+
+    def format_job_counts(self, statuses):
+        """
+        :param statuses: a dict of job status to job count
+
+        :rtype: 2-tuple: (list of lines of a job status table, the number of
+                jobs that have not finished yet)
+        """
         lines = ['Job Status:']
         lines.append("SUB   |PEND  |READY |START |RUN   |FAIL  |SUCCESS ")
         numstr = "{:5d} |{:5d} |{:5d} |{:5d} |{:5d} |{:5d} |{:5d}"
@@ -769,6 +1432,8 @@ class BatchManager(object):
             statuses['SUCCEEDED'],
         )
         lines.append(formstr)
+        if statuses.get('MISSING'):
+            lines.append("{} job(s) unknown to AWS Batch".format(statuses['MISSING']))
 
         runnable_count = 0
         for status in ["SUBMITTED", "PENDING", "RUNNABLE", "STARTING", "RUNNING"]:
@@ -778,53 +1443,155 @@ class BatchManager(object):
         #     lines.append("  {}: {}".format(status, statuses[status]))
         return lines, runnable_count
 
+    def track_jobs(self, job_ids, workers=8):
+        """
+        :rtype: a :py:class:`JobTracker` following just the jobs in ``job_ids``
+        """
+        return JobTracker(self.batch, job_ids, workers=workers)
+
+    def iter_job_events(self, queue=None, job_ids=None, stop_when_done=True, workers=8):
+        """
+        Watch either the jobs in ``queue`` or just the jobs in ``job_ids``, and
+        yield a :py:class:`JobEvent` each time one of them changes status.
+        The first look at the jobs yields an event for each of them, with an
+        ``old_status`` of ``None``.
+
+        Between looks we back off with our :py:class:`batchbeagle.poll.Poller`,
+        dropping back to its shortest interval whenever something changes; if
+        the poller has a timeout, :py:class:`batchbeagle.poll.PollTimeout` is
+        raised when it runs out.
+
+        :param stop_when_done: stop once none of the jobs are unfinished
+                               instead of watching forever
+        """
+        if not (queue or job_ids):
+            raise ValueError("iter_job_events() needs a queue or job ids to watch")
+        watcher = JobWatcher(self, queue=queue, job_ids=job_ids, workers=workers)
+        for events in self.poller.states(watcher.poll):
+            for event in events:
+                yield event
+            if stop_when_done and watcher.done:
+                return
+
     def cancel_job(self, job_id, reason):
         self.batch.cancel_job(jobId=job_id, reason=reason)
 
     def terminate_job(self, job_id, reason):
         self.batch.terminate_job(jobId=job_id, reason=reason)
 
-    def cancel_all_jobs(self, queue):
+    @staticmethod
+    def _job_filter(name_prefix=None, created_after=None, created_before=None):
+        """
+        :param created_after: milliseconds since the epoch
+        :param created_before: milliseconds since the epoch
+
+        :rtype: a ``match`` function for ``get_jobs()``, or ``None`` if there is
+                nothing to filter on
+        """
+        if not (name_prefix or created_after or created_before):
+            return None
+
+        def match(job):
+            if name_prefix and not job['jobName'].startswith(name_prefix):
+                return False
+            if created_after and job.get('createdAt', 0) < created_after:
+                return False
+            if created_before and job.get('createdAt', 0) > created_before:
+                return False
+            return True
+        return match
+
+    def _act_on_all_jobs(self, action, statuses, queue, reason, workers, **filters):
+        """
+        Call ``action(job_id, reason)`` for every job in ``queue`` with one of
+        ``statuses`` that passes ``filters`` (see ``_job_filter()``), from a
+        pool of ``workers`` threads sharing a rate limit.
+
+        :rtype: 2-tuple: (number of jobs acted on, list of (job id, exception)
+                for the ones that failed)
+        """
+        jobs, counts = self.get_jobs(queue, statuses=statuses, match=self._job_filter(**filters))
+        if not jobs:
+            return 0, []
+        limiter = AdaptiveRateLimiter()
+
+        def act(job_id):
+            try:
+                limiter.call(action, job_id, reason)
+            except Exception as e:
+                return job_id, e
+
+        pool = ThreadPool(min(workers, len(jobs)))
+        try:
+            failures = [failure for failure in pool.imap_unordered(act, jobs) if failure]
+        finally:
+            pool.close()
+            pool.join()
+        return len(jobs), failures
+
+    def cancel_all_jobs(self, queue, workers=8, **filters):
+        """
+        Cancel the jobs in ``queue`` that have not been started yet.  Accepts
+        the ``name_prefix``, ``created_after`` and ``created_before`` filters of
+        ``_job_filter()``.
+        """
         reason = "Cancelling all jobs."
-        jobs, statuses = self.get_jobs(queue)
-        for job in jobs:
-            self.cancel_job(job, reason)
+        return self._act_on_all_jobs(self.cancel_job, self.CANCELLABLE_STATUSES, queue, reason, workers, **filters)
 
-    def terminate_all_jobs(self, queue):
+    def terminate_all_jobs(self, queue, workers=8, **filters):
+        """
+        Terminate the jobs in ``queue`` that are starting or running.  Accepts
+        the ``name_prefix``, ``created_after`` and ``created_before`` filters of
+        ``_job_filter()``.
+        """
         reason = "Terminating all jobs."
-        jobs, statuses = self.get_jobs(queue)
-        for job in jobs:
-            self.terminate_job(job, reason)
+        return self._act_on_all_jobs(self.terminate_job, self.TERMINABLE_STATUSES, queue, reason, workers, **filters)
+
+    def stop_all_jobs(self, queue, workers=8, **filters):
+        """
+        Cancel or terminate every unfinished job in ``queue``, as appropriate
+        to its status.
+        """
+        cancelled, cancel_failures = self.cancel_all_jobs(queue, workers, **filters)
+        terminated, terminate_failures = self.terminate_all_jobs(queue, workers, **filters)
+        return cancelled + terminated, cancel_failures + terminate_failures
 
     def create_queue(self, queue):
+        self.load_aws()
         if queue in self.queues:
             q = self.queues[queue]
             if not q.exists():
                 kwargs = q.render()
                 response = self.batch.create_job_queue(**kwargs)
+                self.invalidate_aws()
             else:
                 print("Queue already exists.")
 
     def update_queue(self, queue):
+        self.load_aws()
         if queue in self.queues:
             q = self.queues[queue]
             if q.exists():
                 kwargs = q.render(True)
                 response = self.batch.update_job_queue(**kwargs)
+                self.invalidate_aws()
             else:
                 print("Queue must be created first.")
 
     def disable_queue(self, queue):
+        self.load_aws()
         if queue in self.queues:
             q = self.queues[queue]
             if q.exists():
                 kwargs = q.render(True)
                 kwargs['state'] = 'DISABLED'
                 response = self.batch.update_job_queue(**kwargs)
+                self.invalidate_aws()
             else:
                 print("Queue must be created first.")
 
     def destroy_queue(self, queue):
+        self.load_aws()
         if queue in self.queues:
             q = self.queues[queue]
             if q.exists():
@@ -832,38 +1599,46 @@ class BatchManager(object):
                     print("Queue must be disabled first.")
                     return
                 response = self.batch.delete_job_queue(jobQueue=queue)
+                self.invalidate_aws()
             else:
                 print("Queue doesn't exist.")
 
     def create_compute_environment(self, compute_environment):
+        self.load_aws()
         if compute_environment in self.compute_environments:
             c = self.compute_environments[compute_environment]
             if not c.exists():
                 kwargs = c.render()
                 response = self.batch.create_compute_environment(**kwargs)
+                self.invalidate_aws()
             else:
                 print("Compute Environment already exists.")
 
     def update_compute_environment(self, compute_environment):
+        self.load_aws()
         if compute_environment in self.compute_environments:
             c = self.compute_environments[compute_environment]
             if c.exists():
                 kwargs = c.render(True)
                 response = self.batch.update_compute_environment(**kwargs)
+                self.invalidate_aws()
             else:
                 print("Compute Environment must be created first.")
 
     def disable_compute_environment(self, compute_environment):
+        self.load_aws()
         if compute_environment in self.compute_environments:
             c = self.compute_environments[compute_environment]
             if c.exists():
                 kwargs = c.render(True)
                 kwargs['state'] = 'DISABLED'
                 response = self.batch.update_compute_environment(**kwargs)
+                self.invalidate_aws()
             else:
                 print("Compute Environment must be created first.")
 
     def destroy_compute_environment(self, compute_environment):
+        self.load_aws()
         if compute_environment in self.compute_environments:
             c = self.compute_environments[compute_environment]
             if c.exists():
@@ -872,6 +1647,7 @@ class BatchManager(object):
                 response = self.batch.delete_compute_environment(
                     computeEnvironment=compute_environment
                 )
+                self.invalidate_aws()
             else:
                 print("Compute Environment doesn't exist.")
 
@@ -885,6 +1661,7 @@ class BatchManager(object):
         return description
 
     def describe(self):
+        self.load_aws()
         description = ['Queues:']
         for name, queue in self.queues.items():
             description.extend(self.indent_description(queue.describe()))
@@ -900,99 +1677,257 @@ class BatchManager(object):
         return description
 
     def assemble(self):
+        with self._frozen_aws():
+            self.__assemble()
 
-        # compute environments
-        compute_environments = set(self.compute_environments.keys())
-        for compute_environment in compute_environments:
-            c = self.compute_environments[compute_environment]
-            if not c.exists():
-                self.create_compute_environment(compute_environment)
-            else:
-                self.update_compute_environment(compute_environment)
+    def plan_compute_environment(self, compute_environment):
+        """
+        :rtype: a :py:class:`ResourcePlan` for ``compute_environment``
+        """
+        self.load_aws()
+        return self._compute_environment_plan(self.compute_environments[compute_environment])
 
-        while True:
-            time.sleep(1)
-            if compute_environments.issubset([
-                env_dict['computeEnvironmentName']
-                for env_dict in self.__get_compute_environments()
-                if env_dict['status'] == 'VALID'
-            ]):
-                break
+    @staticmethod
+    def _compute_environment_plan(c):
+        """
+        Compare ``c`` with the AWS state it was last given.  AWS moves
+        ``desiredvCpus`` around as the environment scales, so it is not a
+        change.
+        """
+        if not c.exists():
+            return ResourcePlan('compute environment', c.name, ResourcePlan.CREATE)
+        changes = diff(
+            c.render(True),
+            c.aws_description(),
+            ignore=('computeEnvironment', 'computeResources.desiredvCpus')
+        )
+        return ResourcePlan('compute environment', c.name, ResourcePlan.UPDATE if changes else None, changes)
 
-        self.from_aws()
+    def plan_queue(self, queue):
+        """
+        :rtype: a :py:class:`ResourcePlan` for ``queue``
+        """
+        self.load_aws()
+        return self._queue_plan(self.queues[queue])
 
-        # queues
-        queues = set(self.queues.keys())
-        for queue in queues:
-            q = self.queues[queue]
-            if not q.exists():
-                self.create_queue(queue)
-            else:
-                self.update_queue(queue)
+    @staticmethod
+    def _queue_plan(q):
+        """
+        Compare ``q`` with the AWS state it was last given.
+        """
+        if not q.exists():
+            return ResourcePlan('queue', q.name, ResourcePlan.CREATE)
+        by_order = lambda ceo: ceo['order']
+        desired = dict(q.render(True))
+        desired['computeEnvironmentOrder'] = sorted(desired.get('computeEnvironmentOrder', []), key=by_order)
+        live = dict(q.aws_description())
+        live['computeEnvironmentOrder'] = sorted(live.get('computeEnvironmentOrder', []), key=by_order)
+        changes = diff(desired, live, ignore=('jobQueue',))
+        return ResourcePlan('queue', q.name, ResourcePlan.UPDATE if changes else None, changes)
+
+    def plan_job_definition(self, job_definition):
+        """
+        :rtype: a :py:class:`ResourcePlan` for ``job_definition``
+        """
+        jd = self.job_definitions[job_definition]
+        return self._job_definition_plan(jd, jd.latest_active())
 
-        self.from_aws()
+    @staticmethod
+    def _job_definition_plan(jd, latest):
+        """
+        Compare ``jd`` with ``latest``, the description of its latest ACTIVE
+        revision (or ``None``).
+        """
+        if not latest:
+            return ResourcePlan('job definition', jd.name, ResourcePlan.CREATE)
+        if jd.is_current(latest):
+            return ResourcePlan('job definition', jd.name)
+        changes = diff(jd.render(), latest, ignore=('jobDefinitionName',))
+        if not changes:
+            # e.g. a revision registered before we started tagging them
+            changes = [('tags.' + jd.HASH_TAG, latest.get('tags', {}).get(jd.HASH_TAG), jd.payload_hash())]
+        return ResourcePlan('job definition', jd.name, ResourcePlan.REGISTER, changes)
+
+    def plan(self):
+        """
+        Work out what ``assemble()`` would change, without changing anything.
 
-        # job definitions
-        for job_definition in self.job_definitions.keys():
-            self.create_job_definition(job_definition)
+        :rtype: a :py:class:`Plan`
+        """
+        self.load_aws()
+        resources = [self.plan_compute_environment(name) for name in sorted(self.compute_environments)]
+        resources.extend(self.plan_queue(name) for name in sorted(self.queues))
+        names = sorted(self.job_definitions)
+        if names:
+            pool = ThreadPool(min(self.DESCRIBE_WORKERS, len(names)))
+            try:
+                resources.extend(pool.map(self.plan_job_definition, names))
+            finally:
+                pool.close()
+                pool.join()
+        return Plan(resources)
+
+    def __wait_until_valid(self, compute_environment):
+        """
+        Wait for ``compute_environment`` to become VALID.
+
+        :rtype: the compute environment's description dict
+        """
+        env = self.poller.wait(
+            lambda: self.__describe_compute_environments([compute_environment]).get(compute_environment, {}),
+            lambda env_dict: env_dict.get('status') in ('VALID', 'INVALID')
+        )
+        if env['status'] == 'INVALID':
+            raise ResourceError("Compute environment {} is INVALID: {}".format(
+                compute_environment, env.get('statusReason', '')
+            ))
+        return env
+
+    def __assemble_compute_environment(self, compute_environment):
+        c = self.compute_environments[compute_environment]
+        if not c.exists():
+            self.create_compute_environment(compute_environment)
+        elif self.plan_compute_environment(compute_environment).action:
+            self.update_compute_environment(compute_environment)
+        return self.__wait_until_valid(compute_environment)
+
+    def __assemble_queue(self, queue, env_results):
+        q = self.queues[queue]
+        envs = []
+        for name in q.compute_environments:
+            if name in env_results:
+                envs.append(env_results[name].get())
+            else:
+                # not one of ours, but it still has to be VALID before we can use it
+                envs.append(self.__wait_until_valid(name))
+        q.update_compute_environments(envs)
+        if not q.exists():
+            self.create_queue(queue)
+        elif self.plan_queue(queue).action:
+            self.update_queue(queue)
+
+    def __assemble(self):
+        """
+        Create or update everything, each resource as soon as the resources it
+        depends on are ready: job definitions depend on nothing, compute
+        environments depend on nothing, and each queue depends only on the
+        compute environments listed under it.
+        """
+        pools = [
+            ThreadPool(max(1, min(self.ASSEMBLE_WORKERS, len(resources))))
+            for resources in (self.job_definitions, self.compute_environments, self.queues)
+        ]
+        jd_pool, env_pool, queue_pool = pools
+        try:
+            jd_results = [
+                jd_pool.apply_async(self.create_job_definition, (job_definition,))
+                for job_definition in self.job_definitions
+            ]
+            env_results = dict(
+                (name, env_pool.apply_async(self.__assemble_compute_environment, (name,)))
+                for name in self.compute_environments
+            )
+            # queue workers block on their compute environments' results, so
+            # they get a pool of their own
+            queue_results = [
+                queue_pool.apply_async(self.__assemble_queue, (queue, env_results))
+                for queue in self.queues
+            ]
+            for result in jd_results + list(env_results.values()) + queue_results:
+                result.get()
+        finally:
+            for pool in pools:
+                pool.close()
+                pool.join()
 
     def teardown(self):
+        with self._frozen_aws():
+            self.__teardown()
 
-        # job definitions
-        for job_definition in self.job_definitions.keys():
-            self.deregister_job_definition(job_definition)
-
-        # job queues
-        queues = list(self.queues.keys())
-        for queue in queues:
-            self.terminate_all_jobs(queue)
-
-        for queue_dict in self.__get_queues():
-            if queue_dict['state'] != 'DISABLED':
-                self.disable_queue(queue_dict['jobQueueName'])
-
-        enabled = [True]
-        while any(enabled):
-            time.sleep(1)
-            enabled = []
-            for queue_dict in self.__get_queues():
-                enabled.append(queue_dict['state'] != 'DISABLED' or queue_dict['status'] == 'UPDATING')
-
-        self.from_aws()
-
-        for queue_dict in self.__get_queues():
-            if queue_dict['status'] not in ('DELETED', 'DELETING'):
-                self.destroy_queue(queue_dict['jobQueueName'])
-
-        exists = [True]
-        while any(exists):
-            time.sleep(1)
-            exists = []
-            for queue_dict in self.__get_queues():
-                exists.append(queue_dict['status'] != 'DELETED')
-
-        self.from_aws()
-
-        # compute environments
-        for env_dict in self.__get_compute_environments():
-            if env_dict['state'] != 'DISABLED':
-                self.disable_compute_environment(env_dict['computeEnvironmentName'])
-
-        enabled = [True]
-        while any(enabled):
-            time.sleep(1)
-            enabled = []
-            for env_dict in self.__get_compute_environments():
-                enabled.append(env_dict['state'] != 'DISABLED' or env_dict['status'] == 'UPDATING')
-
-        self.from_aws()
-
-        for compute_environment in self.compute_environments.keys():
-            self.destroy_compute_environment(compute_environment)
-
-        exists = [True]
-        while any(exists):
-            time.sleep(1)
-            exists = []
-            for env_dict in self.__get_compute_environments():
-                exists.append(env_dict['status'] != 'DELETED')
+    def __report(self, kind, name, step, started):
+        print("{} {}: {} after {:.1f}s".format(kind, name, step, time.time() - started))
+
+    def __retire(self, resource, describe, disable, destroy):
+        """
+        Take one queue or compute environment through disable, wait, delete,
+        wait, refreshing its AWS state from ``describe()`` along the way.
+        """
+        state = describe()
+        if state and state['state'] != 'DISABLED':
+            disable()
+        state = self.poller.wait(
+            describe,
+            lambda state: not state or (state['state'] == 'DISABLED' and state['status'] != 'UPDATING')
+        )
+        resource.from_aws(state or None)
+        yield 'disabled'
+        if state and state['status'] not in ('DELETED', 'DELETING'):
+            destroy()
+        self.poller.wait(describe, lambda state: not state or state['status'] == 'DELETED')
+        resource.from_aws(None)
+        yield 'deleted'
+
+    def __teardown_queue(self, queue):
+        started = time.time()
+        q = self.queues[queue]
+        if not q.exists():
+            return
+        self.stop_all_jobs(queue)
+        self.__report('Queue', queue, 'jobs stopped', started)
+        steps = self.__retire(
+            q,
+            lambda: self.__describe_queues([queue]).get(queue, {}),
+            lambda: self.disable_queue(queue),
+            lambda: self.destroy_queue(queue)
+        )
+        for step in steps:
+            self.__report('Queue', queue, step, started)
+
+    def __teardown_compute_environment(self, compute_environment, queue_results):
+        # Wait for every queue that uses us to be deleted first
+        for queue, result in queue_results.items():
+            if compute_environment in self.queues[queue].compute_environments:
+                result.get()
+        started = time.time()
+        c = self.compute_environments[compute_environment]
+        if not c.exists():
+            return
+        steps = self.__retire(
+            c,
+            lambda: self.__describe_compute_environments([compute_environment]).get(compute_environment, {}),
+            lambda: self.disable_compute_environment(compute_environment),
+            lambda: self.destroy_compute_environment(compute_environment)
+        )
+        for step in steps:
+            self.__report('Compute environment', compute_environment, step, started)
+
+    def __teardown(self):
+        """
+        Tear down every resource concurrently, each one moving through its own
+        terminate, disable, wait, delete steps.  A compute environment is torn
+        down as soon as the queues in our config that use it are gone.
+        """
+        pools = [
+            ThreadPool(max(1, min(self.ASSEMBLE_WORKERS, len(resources))))
+            for resources in (self.job_definitions, self.queues, self.compute_environments)
+        ]
+        jd_pool, queue_pool, env_pool = pools
+        try:
+            jd_results = [
+                jd_pool.apply_async(self.deregister_job_definition, (job_definition,))
+                for job_definition in self.job_definitions
+            ]
+            queue_results = dict(
+                (queue, queue_pool.apply_async(self.__teardown_queue, (queue,)))
+                for queue in self.queues
+            )
+            env_results = [
+                env_pool.apply_async(self.__teardown_compute_environment, (name, queue_results))
+                for name in self.compute_environments
+            ]
+            for result in jd_results + list(queue_results.values()) + env_results:
+                result.get()
+        finally:
+            for pool in pools:
+                pool.close()
+                pool.join()
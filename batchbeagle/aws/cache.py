@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'batchbeagle')
+
+# how long we remember which account a set of credentials belongs to
+ACCOUNT_TTL = 86400
+
+
+def read_entry(path, ttl):
+    """
+    :rtype: the value stored at ``path`` by ``write_entry()``, or ``None`` if
+            there is none or it is more than ``ttl`` seconds old
+    """
+    try:
+        with open(path) as f:
+            entry = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if time.time() - entry['stored'] > ttl:
+        return None
+    return entry['value']
+
+
+def write_entry(path, value):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # another thread or process got there first
+            pass
+    fd, tmp = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'stored': time.time(), 'value': value}, f, default=str)
+    os.rename(tmp, path)
+
+
+def account_id(session, directory=DEFAULT_DIRECTORY):
+    """
+    Return the AWS account id that ``session``'s credentials belong to.  We
+    ask STS once and remember the answer under ``directory`` for a day,
+    keyed by the access key.
+    """
+    credentials = session.get_credentials()
+    access_key = credentials.get_frozen_credentials().access_key if credentials else 'anonymous'
+    path = os.path.join(directory, 'accounts', hashlib.sha256(access_key.encode('utf-8')).hexdigest())
+    account = read_entry(path, ACCOUNT_TTL)
+    if account is None:
+        account = session.client('sts').get_caller_identity()['Account']
+        write_entry(path, account)
+    return account
+
+
+class _CachedHTTPResponse(object):
+    """
+    Stands in for the botocore HTTP response when we answer a call from the
+    cache; botocore only looks at its ``status_code``.
+    """
+
+    status_code = 200
+    headers = {}
+
+
+class DescribeCache(object):
+    """
+    An on-disk cache of the results of read-only Batch API calls, attached to
+    a client through botocore's ``before-call`` and ``after-call`` events.
+
+    Results are stored under ``directory/<account>/<region>/<operation>/`` and
+    keyed by a hash of the serialized request.  Each operation in ``TTLS`` has
+    its own time to live, in seconds.  Any mutating call made through the
+    client throws away the cached results it could have changed.
+
+    Results are always written, but only served while ``reads`` is ``True``:
+    commands that wait for things to change need live answers.
+    """
+
+    TTLS = {
+        'DescribeJobQueues': 60,
+        'DescribeComputeEnvironments': 60,
+        'DescribeJobDefinitions': 300,
+        'ListJobs': 10,
+        'DescribeJobs': 10,
+    }
+
+    INVALIDATES = {
+        'CreateJobQueue': ('DescribeJobQueues',),
+        'UpdateJobQueue': ('DescribeJobQueues',),
+        'DeleteJobQueue': ('DescribeJobQueues',),
+        'CreateComputeEnvironment': ('DescribeComputeEnvironments', 'DescribeJobQueues'),
+        'UpdateComputeEnvironment': ('DescribeComputeEnvironments', 'DescribeJobQueues'),
+        'DeleteComputeEnvironment': ('DescribeComputeEnvironments', 'DescribeJobQueues'),
+        'RegisterJobDefinition': ('DescribeJobDefinitions',),
+        'DeregisterJobDefinition': ('DescribeJobDefinitions',),
+        'SubmitJob': ('ListJobs', 'DescribeJobs'),
+        'CancelJob': ('ListJobs', 'DescribeJobs'),
+        'TerminateJob': ('ListJobs', 'DescribeJobs'),
+    }
+
+    def __init__(self, directory=None, ttls=None, reads=False):
+        self.directory = directory or DEFAULT_DIRECTORY
+        self.ttls = dict(self.TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.reads = reads
+        self.hits = 0
+        self.misses = 0
+        self.__scope = None
+        self.__client = None
+        self.__session = None
+
+    def attach(self, client, session):
+        """
+        Start caching the calls ``client`` makes.  ``session`` is the boto3
+        session the client came from, used to look up the account id.
+        """
+        self.__client = client
+        self.__session = session
+        client.meta.events.register('before-call.batch', self._before_call)
+        client.meta.events.register('after-call.batch', self._after_call)
+
+    def _account(self):
+        return account_id(self.__session, self.directory)
+
+    def _scope(self):
+        if self.__scope is None:
+            self.__scope = os.path.join(self.directory, self._account(), self.__client.meta.region_name)
+        return self.__scope
+
+    def _path(self, operation, request):
+        key = json.dumps(
+            [request.get('url_path'), request.get('query_string'), request.get('body')],
+            sort_keys=True,
+            default=str
+        )
+        return os.path.join(self._scope(), operation, hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+    def invalidate(self, operations=None):
+        """
+        Throw away the cached results of ``operations`` (all of them by
+        default) for our account and region.
+        """
+        for operation in operations or self.ttls:
+            shutil.rmtree(os.path.join(self._scope(), operation), ignore_errors=True)
+
+    def _before_call(self, model, params, context, **kwargs):
+        if model.name in self.INVALIDATES:
+            self.invalidate(self.INVALIDATES[model.name])
+            return None
+        if model.name not in self.ttls:
+            return None
+        path = self._path(model.name, params)
+        # after-call doesn't get to see the request, so remember where it goes
+        context['beagle_cache_path'] = path
+        if not self.reads:
+            return None
+        parsed = read_entry(path, self.ttls[model.name])
+        if parsed is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        context['beagle_cache_hit'] = True
+        return _CachedHTTPResponse(), parsed
+
+    def _after_call(self, http_response, parsed, model, context, **kwargs):
+        if model.name in self.INVALIDATES:
+            # in case someone cached a result while the call was in flight
+            self.invalidate(self.INVALIDATES[model.name])
+            return
+        if 'beagle_cache_path' not in context or context.get('beagle_cache_hit'):
+            return
+        if http_response is None or http_response.status_code >= 300:
+            return
+        write_entry(context['beagle_cache_path'], parsed)
@@ -0,0 +1,50 @@
+import boto3
+from botocore.config import Config as BotoConfig
+
+from batchbeagle.aws.throttle import defer_throttles_to_limiter
+
+
+def make_batch_client(session=None, max_pool_connections=50, retry_mode='standard', max_attempts=5,
+                      connect_timeout=10, read_timeout=60, cache=None, profiler=None,
+                      bucket=None):
+    """
+    Build the one Batch client that a :py:class:`batchbeagle.aws.batch.BatchManager`
+    shares with all of its queues, compute environments and job definitions.
+
+    botocore clients are thread safe, so the concurrent parts of batchbeagle
+    share this client too; ``max_pool_connections`` should be at least as big
+    as the largest thread pool so that every thread can keep its HTTP
+    connection alive.
+
+    :param session: the ``boto3.session.Session`` to use.  Default: a new session
+    :param retry_mode: botocore's retry mode: ``legacy``, ``standard`` or ``adaptive``.
+                       Throttled calls made through a
+                       :py:class:`batchbeagle.aws.throttle.AdaptiveRateLimiter`
+                       are never retried by botocore, so the limiter sees every
+                       throttle
+    :param cache: a :py:class:`batchbeagle.aws.cache.DescribeCache` to attach to the client
+    :param profiler: a :py:class:`batchbeagle.aws.profiler.ApiProfiler` to attach to the client
+    :param bucket: a :py:class:`batchbeagle.aws.throttle.SharedTokenBucket` for
+                   the client's requests to draw from
+    """
+    if session is None:
+        session = boto3.session.Session()
+    config = BotoConfig(
+        max_pool_connections=max_pool_connections,
+        retries={'mode': retry_mode, 'max_attempts': max_attempts},
+        connect_timeout=connect_timeout,
+        read_timeout=read_timeout
+    )
+    client = session.client('batch', config=config)
+    # ahead of botocore's own retry handler, so it never counts the retry
+    client.meta.events.register_first('needs-retry.batch', defer_throttles_to_limiter)
+    # before the cache, so that the profiler sees the calls it answers
+    if profiler:
+        profiler.attach(client)
+    if cache:
+        cache.attach(client, session)
+    # requests the cache answers never get as far as being sent, so they
+    # cost no tokens
+    if bucket:
+        bucket.attach(client, session)
+    return client
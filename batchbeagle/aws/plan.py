@@ -0,0 +1,81 @@
+class ResourcePlan(object):
+    """
+    What ``assemble`` would have to do to one resource to make it match our
+    configuration.
+
+    ``action`` is one of ``CREATE``, ``UPDATE``, ``REGISTER`` (a new job
+    definition revision) or ``None`` if the resource is already up to date.
+    ``changes`` is a list of ``(path, live value, configured value)`` tuples.
+    """
+
+    CREATE = 'create'
+    UPDATE = 'update'
+    REGISTER = 'register'
+
+    SYMBOLS = {
+        CREATE: '+',
+        UPDATE: '~',
+        REGISTER: '~',
+        None: ' ',
+    }
+
+    def __init__(self, kind, name, action=None, changes=None):
+        self.kind = kind
+        self.name = name
+        self.action = action
+        self.changes = changes or []
+
+    def describe(self):
+        line = "{} {} {}".format(self.SYMBOLS[self.action], self.kind, self.name)
+        if self.action == self.REGISTER:
+            line += " (new revision)"
+        description = [line]
+        for path, old, new in self.changes:
+            description.append("    {}: {!r} -> {!r}".format(path, old, new))
+        return description
+
+
+class Plan(object):
+
+    def __init__(self, resources):
+        self.resources = resources
+
+    def count(self, action):
+        return len([resource for resource in self.resources if resource.action == action])
+
+    def describe(self):
+        description = []
+        for resource in self.resources:
+            description.extend(resource.describe())
+        description.append("")
+        description.append("Plan: {} to create, {} to update, {} unchanged".format(
+            self.count(ResourcePlan.CREATE),
+            self.count(ResourcePlan.UPDATE) + self.count(ResourcePlan.REGISTER),
+            self.count(None)
+        ))
+        return description
+
+
+def diff(desired, live, ignore=(), path=''):
+    """
+    Compare the ``render()`` output ``desired`` with the AWS description
+    ``live``, key by key.  Only keys present in ``desired`` are compared, since
+    AWS fills in defaults for everything we leave out; nested dicts are
+    compared recursively and everything else, lists included, as a whole.
+    Keys whose dotted path, e.g. ``computeResources.desiredvCpus``, is in
+    ``ignore`` are skipped.
+
+    :rtype: list of ``(path, live value, desired value)`` tuples
+    """
+    changes = []
+    for key in sorted(desired):
+        key_path = "{}.{}".format(path, key) if path else key
+        if key_path in ignore:
+            continue
+        value = desired[key]
+        live_value = live.get(key) if live else None
+        if isinstance(value, dict) and isinstance(live_value, dict):
+            changes.extend(diff(value, live_value, ignore=ignore, path=key_path))
+        elif value != live_value:
+            changes.append((key_path, live_value, value))
+    return changes
@@ -0,0 +1,169 @@
+import json
+import threading
+import time
+
+from batchbeagle.aws.throttle import THROTTLING_ERROR_CODES, is_throttling_error
+
+
+class OperationStats(object):
+    """
+    What we know about the calls to one Batch API operation.  Latencies are
+    counted in a histogram whose buckets end at ``BUCKETS`` milliseconds.
+    """
+
+    BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf'))
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.throttles = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.histogram = [0] * len(self.BUCKETS)
+
+    def add(self, seconds, error=False, retries=0):
+        self.calls += 1
+        self.errors += int(error)
+        self.retries += retries
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        ms = seconds * 1000
+        for i, bound in enumerate(self.BUCKETS):
+            if ms <= bound:
+                self.histogram[i] += 1
+                break
+
+    def percentile(self, fraction):
+        """
+        :rtype: the upper bound, in milliseconds, of the histogram bucket
+                holding the ``fraction`` percentile call
+        """
+        wanted = fraction * self.calls
+        seen = 0
+        for bound, count in zip(self.BUCKETS, self.histogram):
+            seen += count
+            if count and seen >= wanted:
+                return min(bound, self.max_seconds * 1000)
+        return 0.0
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'retries': self.retries,
+            'throttles': self.throttles,
+            'seconds': self.seconds,
+            'max_seconds': self.max_seconds,
+            'histogram': dict(
+                ('<={}ms'.format(bound) if bound != float('inf') else '>{}ms'.format(self.BUCKETS[-2]), count)
+                for bound, count in zip(self.BUCKETS, self.histogram)
+            ),
+        }
+
+
+class ApiProfiler(object):
+    """
+    Records where a command's time goes, by listening to botocore's events on
+    the shared Batch client: calls, latency, retries and throttles for each
+    API operation.  Time spent sleeping in wait loops comes from the
+    :py:class:`batchbeagle.poll.Poller` given to ``report()``.
+
+    Latency is measured from ``before-call`` to ``after-call``, so it includes
+    botocore's own retries and backoff.  Retries are the HTTP requests sent
+    for a call after its first.  Attach the profiler before any
+    :py:class:`batchbeagle.aws.cache.DescribeCache`, or calls the cache
+    answers aren't seen at all.
+    """
+
+    def __init__(self):
+        self.operations = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def attach(self, client):
+        client.meta.events.register_first('before-call.batch', self._before_call)
+        client.meta.events.register('request-created.batch', self._request_created)
+        client.meta.events.register('after-call.batch', self._after_call)
+        client.meta.events.register('after-call-error.batch', self._after_call_error)
+        client.meta.events.register('needs-retry.batch', self._needs_retry)
+
+    def _stats(self, operation):
+        if operation not in self.operations:
+            self.operations[operation] = OperationStats()
+        return self.operations[operation]
+
+    def _before_call(self, model, context, **kwargs):
+        context['beagle_profile_start'] = time.time()
+        context['beagle_profile_operation'] = model.name
+        context['beagle_profile_attempts'] = 0
+
+    def _request_created(self, request, **kwargs):
+        # once per HTTP request, so once per attempt
+        context = getattr(request, 'context', None)
+        if context and 'beagle_profile_attempts' in context:
+            context['beagle_profile_attempts'] += 1
+
+    def _finish(self, context, error, throttled=False):
+        started = context.get('beagle_profile_start')
+        if started is None:
+            return
+        # calls the cache answers are never sent at all
+        retries = max(context['beagle_profile_attempts'] - 1, 0)
+        with self._lock:
+            stats = self._stats(context['beagle_profile_operation'])
+            stats.add(time.time() - started, error, retries)
+            stats.throttles += int(throttled)
+
+    def _after_call(self, http_response, parsed, model, context, **kwargs):
+        self._finish(context, http_response.status_code >= 300)
+
+    def _after_call_error(self, exception, context, **kwargs):
+        # a throttle raised straight back to an AdaptiveRateLimiter never
+        # reaches our needs-retry handler
+        self._finish(context, True, is_throttling_error(exception))
+
+    def _needs_retry(self, response=None, operation=None, **kwargs):
+        # botocore asks after every attempt; we only count throttles, and
+        # leave the deciding to its retry handler
+        if operation is None or response is None:
+            return None
+        http, parsed = response
+        if parsed.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES:
+            with self._lock:
+                self._stats(operation.name).throttles += 1
+        return None
+
+    def as_dict(self, poller=None):
+        return {
+            'elapsed': time.time() - self.started,
+            'slept': poller.slept if poller else None,
+            'operations': dict((name, stats.as_dict()) for name, stats in self.operations.items()),
+        }
+
+    def report(self, poller=None):
+        """
+        :rtype: list of lines of a summary table, slowest operations first
+        """
+        lines = ["{:<30} {:>6} {:>5} {:>7} {:>8} {:>9} {:>8} {:>8} {:>8}".format(
+            'operation', 'calls', 'errs', 'retries', 'throttle', 'total s', 'p50 ms', 'p90 ms', 'max ms'
+        )]
+        by_time = sorted(self.operations.items(), key=lambda item: item[1].seconds, reverse=True)
+        for name, stats in by_time:
+            lines.append("{:<30} {:>6} {:>5} {:>7} {:>8} {:>9.2f} {:>8.0f} {:>8.0f} {:>8.0f}".format(
+                name, stats.calls, stats.errors, stats.retries, stats.throttles, stats.seconds,
+                stats.percentile(0.5), stats.percentile(0.9), stats.max_seconds * 1000
+            ))
+        summary = "{} API calls taking {:.2f}s in all, over {:.2f}s".format(
+            sum(stats.calls for stats in self.operations.values()),
+            sum(stats.seconds for stats in self.operations.values()),
+            time.time() - self.started
+        )
+        if poller:
+            summary += "; {:.2f}s sleeping in wait loops".format(poller.slept)
+        lines.append(summary)
+        return lines
+
+    def dump(self, filename, poller=None):
+        with open(filename, 'w') as f:
+            json.dump(self.as_dict(poller), f, indent=2, sort_keys=True)
@@ -0,0 +1,203 @@
+import json
+import os
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+
+THROTTLING_ERROR_CODES = (
+    'TooManyRequestsException',
+    'ThrottlingException',
+    'Throttling',
+    'RequestLimitExceeded',
+)
+
+
+def is_throttling_error(exc):
+    """
+    Return ``True`` if ``exc`` is AWS telling us to slow down.
+    """
+    if isinstance(exc, ClientError):
+        return exc.response.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES
+    return False
+
+
+# which threads are inside an AdaptiveRateLimiter.call()
+_limited = threading.local()
+
+
+def defer_throttles_to_limiter(response=None, operation=None, **kwargs):
+    """
+    A ``needs-retry`` handler that stops botocore from retrying a throttled
+    call made inside :py:meth:`AdaptiveRateLimiter.call`, by raising the
+    throttling error straight away.  The limiter then slows down after the
+    first throttle rather than after botocore has quietly retried several.
+    Calls made outside a limiter are retried by botocore as usual.
+    """
+    if response is None or operation is None or not getattr(_limited, 'active', False):
+        return None
+    http, parsed = response
+    if parsed.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES:
+        raise ClientError(parsed, operation.name)
+    return None
+
+
+class AdaptiveRateLimiter(object):
+    """
+    A rate limiter shared by a pool of worker threads.
+
+    Callers ``acquire()`` a slot before each API call, then report the outcome
+    with ``success()`` or ``throttled()``.  The allowed rate creeps up by about
+    ``increase`` calls per second for every second of successful calls, and is
+    multiplied by ``decrease`` every time AWS throttles us.
+    """
+
+    def __init__(self, rate=20.0, min_rate=1.0, max_rate=50.0, increase=1.0, decrease=0.5, max_attempts=10):
+        self.rate = float(rate)
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.increase = float(increase)
+        self.decrease = float(decrease)
+        self.max_attempts = max_attempts
+        self.throttle_count = 0
+        self._next = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next)
+            self._next = slot + 1.0 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+    def success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def throttled(self):
+        with self._lock:
+            self.throttle_count += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            # Make everyone waiting behind us feel the slowdown too
+            self._next = max(self._next, time.time() + 1.0 / self.rate)
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call ``func(*args, **kwargs)`` within our rate, retrying it up to
+        ``max_attempts`` times while AWS throttles it.  Clients from
+        :py:func:`batchbeagle.aws.client.make_batch_client` leave throttled
+        calls made here to us instead of retrying them themselves; see
+        :py:func:`defer_throttles_to_limiter`.
+        """
+        attempts = 0
+        while True:
+            attempts += 1
+            self.acquire()
+            outer = getattr(_limited, 'active', False)
+            _limited.active = True
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if is_throttling_error(e):
+                    self.throttled()
+                    if attempts < self.max_attempts:
+                        continue
+                raise
+            finally:
+                _limited.active = outer
+            self.success()
+            return result
+
+
+class SharedTokenBucket(object):
+    """
+    A token bucket shared by every ``beagle`` process on this machine that
+    talks to the same AWS account and region, so that parallel runs share one
+    API budget instead of throttling each other.
+
+    The bucket lives in a small file under ``directory``, guarded by an
+    ``fcntl`` lock.  It refills at ``rate`` tokens per second up to ``burst``
+    tokens, and every HTTP request the client sends (retries included) takes
+    one.  Taking a token never waits on the lock for longer than it takes to
+    read and write the file: the bucket may go into debt, and the taker
+    sleeps off its share of the debt after letting go of the lock.
+    """
+
+    def __init__(self, directory, rate, burst=None):
+        if fcntl is None:
+            raise RuntimeError("A shared rate limit needs fcntl, which this platform doesn't have")
+        self.directory = directory
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.waited = 0.0
+        self.__path = None
+        self.__client = None
+        self.__session = None
+
+    def attach(self, client, session):
+        """
+        Make every request ``client`` sends take a token first.  ``session`` is
+        the boto3 session the client came from, used to look up the account id.
+        """
+        self.__client = client
+        self.__session = session
+        client.meta.events.register('before-send.batch', self._before_send)
+
+    def _path(self):
+        if self.__path is None:
+            # imported here to keep throttle.py free of the cache's imports
+            from batchbeagle.aws.cache import account_id
+            self.__path = os.path.join(
+                self.directory,
+                'buckets',
+                account_id(self.__session, self.directory),
+                self.__client.meta.region_name
+            )
+            if not os.path.isdir(os.path.dirname(self.__path)):
+                try:
+                    os.makedirs(os.path.dirname(self.__path))
+                except OSError:
+                    # another process got there first
+                    pass
+        return self.__path
+
+    def take(self):
+        """
+        Take a token, and return how many seconds to wait before using it.
+        """
+        fd = os.open(self._path(), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            now = time.time()
+            try:
+                state = json.loads(os.read(fd, 1024).decode('utf-8'))
+                tokens = min(self.burst, state['tokens'] + (now - state['updated']) * self.rate)
+            except (ValueError, KeyError):
+                # a new bucket starts full
+                tokens = self.burst
+            tokens -= 1
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, json.dumps({'tokens': tokens, 'updated': now}).encode('utf-8'))
+        finally:
+            # closing the file releases the lock
+            os.close(fd)
+        if tokens >= 0:
+            return 0.0
+        return -tokens / self.rate
+
+    def acquire(self):
+        wait = self.take()
+        if wait:
+            time.sleep(wait)
+            self.waited += wait
+
+    def _before_send(self, **kwargs):
+        self.acquire()
@@ -1,6 +1,15 @@
-import yaml
-import re
+import hashlib
+import json
 import os
+import re
+import tempfile
+
+import yaml
+
+# libyaml's loader is many times faster than the pure Python one; fall back
+# to the latter when PyYAML was built without libyaml
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
 
 class Config(object):
     """
@@ -10,14 +19,29 @@ class Config(object):
     * ``${env.<environment var>}```: If the environment variable
       ``<environment var>`` exists in our environment, replace this with
       the value of that environment variable.
+
+    If ``cache_dir`` is set, the parsed config is kept there as JSON, keyed
+    by the file's path, modification time and size, so that loading an
+    unchanged config again costs no more than reading JSON.  We cache it
+    before any variable substitution, so no environment values are written
+    to disk.  With ``fresh``, we reparse the file and refresh the cache.
     """
 
-    ENVIRONMENT_RE = re.compile('\$\{env\.(\w+)\}')
+    ENVIRONMENT_RE = re.compile(r'\$\{env\.(\w+)\}')
 
-    def __init__(self, filename='batchbeagle.yml', import_env=False, interpolate=True):
-        self.__raw = self.load_config(filename)
+    def __init__(self, filename='batchbeagle.yml', import_env=False, interpolate=True, cache_dir=None, fresh=False):
         self.import_env = import_env
         self.environ = None
+        self.__raw = None
+        cache_path = None
+        if cache_dir:
+            cache_path = self.__cache_path(cache_dir, filename)
+            if not fresh:
+                self.__raw = self.__read_cache(cache_path)
+        if self.__raw is None:
+            self.__raw = self.load_config(filename)
+            if cache_path:
+                self.__write_cache(cache_path)
         if interpolate:
             self.replace()
 
@@ -26,7 +50,7 @@ class Config(object):
 
     def load_config(self, filename):
         with open(filename) as f:
-            return yaml.load(f)
+            return yaml.load(f, Loader=SafeLoader)
 
     def replace(self):
 
@@ -35,15 +59,51 @@ class Config(object):
         each listed job_definitions under the ``job_definitions:`` section.
         """
 
+        self.environ = {}
+        if self.import_env:
+            self.__load_environ()
+        if not self.environ:
+            # nothing could be replaced, so don't bother walking the config
+            return
         for job in self.__raw['job_definitions']:
-            self.environ = {}
-            if self.import_env:
-                self.__load_environ()
             self.__do_dict(job)
 
     def __load_environ(self):
-        for key in os.environ.keys():
-            self.environ[key] = os.getenv(key)
+        self.environ = dict(os.environ)
+
+    def __cache_path(self, cache_dir, filename):
+        stat = os.stat(filename)
+        key = hashlib.sha256()
+        key.update(repr((os.path.abspath(filename), stat.st_mtime, stat.st_size)).encode('utf-8'))
+        return os.path.join(cache_dir, 'config', key.hexdigest())
+
+    def __read_cache(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            # missing or torn: just reparse
+            return None
+
+    def __write_cache(self, path):
+        try:
+            data = json.dumps(self.__raw)
+        except (TypeError, ValueError):
+            return
+        if json.loads(data) != self.__raw:
+            # YAML that JSON can't represent faithfully, like integer keys
+            return
+        directory = os.path.dirname(path)
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory, 0o700)
+            fd, tmp = tempfile.mkstemp(dir=directory)
+            with os.fdopen(fd, 'w') as f:
+                f.write(data)
+            os.rename(tmp, path)
+        except (IOError, OSError):
+            # the cache is only an optimization
+            pass
 
     def __replace(self, raw, key, value):
         if isinstance(value, dict):
@@ -53,20 +113,16 @@ class Config(object):
         elif isinstance(value, str):
             self.__do_string(raw, key, value)
 
-    def __env_replace(self, key):
-        value = self.environ.get(key, "${env.%s}" % key)
-        return value
+    def __env_replace(self, match):
+        return self.environ.get(match.group(1), match.group(0))
 
     def __do_dict(self, raw):
         for key, value in raw.items():
             self.__replace(raw, key, value)
 
     def __do_string(self, raw, key, value):
-        m = self.ENVIRONMENT_RE.findall(value)
-        if m:
-            for match_key in m:
-                value = value.replace("${env.%s}" % match_key, self.__env_replace(match_key))
-                raw[key] = value
+        if '${env.' in value:
+            raw[key] = self.ENVIRONMENT_RE.sub(self.__env_replace, value)
 
     def __do_list(self, raw):
         for i, value in enumerate(raw):
@@ -1,28 +1,120 @@
 #!/usr/bin/env python
 
 import copy
-import csv
+import json
 import time
 
 import click
 
 from batchbeagle.config import Config
 from batchbeagle.aws.batch import BatchManager, Queue
+from batchbeagle.aws.cache import DEFAULT_DIRECTORY, DescribeCache
+from batchbeagle.aws.client import make_batch_client
+from batchbeagle.aws.profiler import ApiProfiler
+from batchbeagle.aws.throttle import SharedTokenBucket
+from batchbeagle.journal import JournalExists, JournalMismatch, SubmissionJournal
+from batchbeagle.pack import pack_rows
+from batchbeagle.params import FORMATS, ParameterFormatError, open_parameter_file
+from batchbeagle.poll import Poller, PollTimeout
+from batchbeagle.shard import ShardFailed, submit_sharded
+from batchbeagle.workflow import Workflow, WorkflowError
 
 @click.group()
 @click.option('--filename', '-f', default='batchbeagle.yml', help="Path to the config file. Default: ./batchbeagle.yml")
 @click.option('--import_env/--no-import_env', '-i', default=False, help="Whether or not to load environment variables from the host")
+@click.option('--poll-interval', default=1.0, type=float, help="Seconds between status checks while waiting, at first. Default: 1")
+@click.option('--max-poll-interval', default=30.0, type=float, help="Longest time between status checks while nothing changes. Default: 30")
+@click.option('--wait-timeout', default=None, type=float, help="Give up waiting after this many seconds. Default: wait forever")
+@click.option('--max-pool-connections', default=50, type=click.IntRange(min=1), help="Size of the AWS API connection pool. Default: 50")
+@click.option('--retry-mode', default='standard', type=click.Choice(['legacy', 'standard', 'adaptive']), help="botocore retry mode for AWS API calls. Default: standard")
+@click.option('--connect-timeout', default=10, type=float, help="Seconds to wait for a connection to the AWS API. Default: 10")
+@click.option('--read-timeout', default=60, type=float, help="Seconds to wait for an AWS API response. Default: 60")
+@click.option('--cache/--no-cache', default=False, help="Cache the parsed config and AWS describe results on disk, and serve read-only commands from them")
+@click.option('--cache-dir', default=None, help="Where to keep the cache. Default: ~/.cache/batchbeagle")
+@click.option('--fresh', is_flag=True, default=False, help="Ignore cached results and the cached config, but still refresh the cache")
+@click.option('--profile-api', is_flag=True, default=False, help="Print a summary of the AWS API calls made when done")
+@click.option('--profile-json', default=None, help="Also write the API call summary to this JSON file")
+@click.option('--shared-rate-limit', default=None, type=click.FloatRange(min=0.1), help="Share a budget of this many AWS API requests per second with every other beagle on this machine using the same account and region")
+@click.option('--shared-burst', default=None, type=click.FloatRange(min=1), help="Requests the shared budget can save up. Default: one second's worth")
 @click.pass_context
-def cli(ctx, filename, import_env):
+def cli(ctx, filename, import_env, poll_interval, max_poll_interval, wait_timeout, max_pool_connections,
+        retry_mode, connect_timeout, read_timeout, cache, cache_dir, fresh, profile_api, profile_json,
+        shared_rate_limit, shared_burst):
     """
     Configure and deploy AWS Batch jobs.
     """
-    ctx.obj['CONFIG'] = Config(filename=filename, import_env=import_env).get_yaml()
+    cache_dir = cache_dir or DEFAULT_DIRECTORY
+    ctx.obj['CONFIG'] = Config(
+        filename=filename,
+        import_env=import_env,
+        cache_dir=cache_dir if cache else None,
+        fresh=fresh
+    ).get_yaml()
+    ctx.obj['POLLER'] = Poller(floor=poll_interval, ceiling=max_poll_interval, timeout=wait_timeout)
+    ctx.obj['CACHE'] = DescribeCache(directory=cache_dir) if cache else None
+    ctx.obj['FRESH'] = fresh
+    profiler = ApiProfiler() if profile_api or profile_json else None
+    # kept for any worker processes, which have to make clients of their own
+    ctx.obj['CLIENT_OPTIONS'] = {
+        'max_pool_connections': max_pool_connections,
+        'retry_mode': retry_mode,
+        'connect_timeout': connect_timeout,
+        'read_timeout': read_timeout,
+    }
+    ctx.obj['BUCKET_OPTIONS'] = None
+    bucket = None
+    if shared_rate_limit:
+        ctx.obj['BUCKET_OPTIONS'] = {'directory': cache_dir, 'rate': shared_rate_limit, 'burst': shared_burst}
+        bucket = SharedTokenBucket(**ctx.obj['BUCKET_OPTIONS'])
+    ctx.obj['BATCH'] = make_batch_client(
+        cache=ctx.obj['CACHE'],
+        profiler=profiler,
+        bucket=bucket,
+        **ctx.obj['CLIENT_OPTIONS']
+    )
+    if profiler:
+        ctx.call_on_close(lambda: report_profile(profiler, ctx.obj['POLLER'], profile_api, profile_json))
+
+
+def report_profile(profiler, poller, show, filename):
+    if show:
+        for line in profiler.report(poller):
+            click.echo(line, err=True)
+    if filename:
+        profiler.dump(filename, poller)
+
+
+def get_manager(ctx, read_only=False):
+    """
+    :param read_only: ``True`` if the command only looks at AWS state, in
+                      which case it may be served from the cache
+    """
+    if read_only and ctx.obj['CACHE'] and not ctx.obj['FRESH']:
+        ctx.obj['CACHE'].reads = True
+    return BatchManager(yml=ctx.obj['CONFIG'], poller=ctx.obj['POLLER'], batch=ctx.obj['BATCH'])
+
+
+def wait_for_jobs(ctx, mgr, count_jobs, nowait=False):
+    """
+    Print the job status table from ``count_jobs()`` until no jobs are left
+    unfinished (or just once, if ``nowait`` is set).
+    """
+    def check():
+        statuses = count_jobs()
+        lines, runnable_count = mgr.format_job_counts(statuses)
+        for line in lines:
+            click.echo(line)
+        return statuses, runnable_count
+
+    try:
+        ctx.obj['POLLER'].wait(check, lambda state: state[1] == 0 or nowait)
+    except PollTimeout as e:
+        raise click.ClickException(str(e))
 
 @cli.command()
 @click.pass_context
 def info(ctx):
-    mgr = BatchManager(yml=ctx.obj['CONFIG'])
+    mgr = get_manager(ctx, read_only=True)
     lines = mgr.describe()
     for line in lines:
         click.echo(line)
@@ -41,7 +133,7 @@ def create(ctx, queue):
     """
     Create a new queue.
     """
-    mgr = BatchManager(yml=ctx.obj['CONFIG'])
+    mgr = get_manager(ctx)
     mgr.create_queue(queue)
 
 @queue.command()
@@ -51,7 +143,7 @@ def update(ctx, queue):
     """
     Update an existing queue.
     """
-    mgr = BatchManager(yml=ctx.obj['CONFIG'])
+    mgr = get_manager(ctx)
     mgr.update_queue(queue)
 
 @queue.command()
@@ -61,7 +153,7 @@ def disable(ctx, queue):
     """
     Disable an existing queue.
     """
-    mgr = BatchManager(yml=ctx.obj['CONFIG'])
+    mgr = get_manager(ctx)
     mgr.disable_queue(queue)
 
 @queue.command()
@@ -71,7 +163,7 @@ def destroy(ctx, queue):
     """
     Destroy an existing queue.
     """
-    mgr = BatchManager(yml=ctx.obj['CONFIG'])
+    mgr = get_manager(ctx)
     mgr.disable_queue(queue)
     time.sleep(1)
     mgr.destroy_queue(queue)
@@ -90,7 +182,7 @@ def create(ctx, compute_environment):
     """
     Create a new compute environment.
     """
-    mgr = BatchManager(yml=ctx.obj['CONFIG'])
+    mgr = get_manager(ctx)
     mgr.create_compute_environment(compute_environment)
 
 @compute.command()
@@ -100,7 +192,7 @@ def update(ctx, compute_environment):
     """
     Update an existing compute environment.
     """
-    mgr = BatchManager(yml=ctx.obj['CONFIG'])
+    mgr = get_manager(ctx)
     mgr.update_compute_environment(compute_environment)
 
 @compute.command()
@@ -110,7 +202,7 @@ def disable(ctx, compute_environment):
     """
     Disable an existing compute environment.
     """
-    mgr = BatchManager(yml=ctx.obj['CONFIG'])
+    mgr = get_manager(ctx)
     mgr.disable_compute_environment(compute_environment)
 
 @compute.command()
@@ -121,7 +213,7 @@ def destroy(ctx, compute_environment):
     Destroy an existing compute environment.
     """
 
-    mgr = BatchManager(yml=ctx.obj['CONFIG'])
+    mgr = get_manager(ctx)
     mgr.disable_compute_environment(compute_environment)
     time.sleep(1)
     mgr.destroy_compute_environment(compute_environment)
@@ -140,26 +232,180 @@ def job():
 @click.argument('queue')
 @click.option('--parameters', '-p', default=None, help="Path to the parameters file.")
 @click.option('--nowait', is_flag=True, default=False, help="Do not wait for all jobs to start running")
-def submit(ctx, name, job_definition, queue, parameters, nowait):
+@click.option('--array', 'array', is_flag=True, default=False, help="Submit the parameters file as array jobs instead of one job per line")
+@click.option('--manifest', default=None, help="Where to write the parameter manifest for --array: a path the containers can read, or s3://bucket/key")
+@click.option('--concurrency', '-c', default=1, type=click.IntRange(min=1), help="Number of jobs to submit in parallel. Default: 1")
+@click.option('--journal', default=None, help="Path to the submission journal. Default: the parameters file path plus .journal")
+@click.option('--resume', is_flag=True, default=False, help="Skip the rows the journal says were already submitted")
+@click.option('--restart', is_flag=True, default=False, help="Start a new journal even if one records an unfinished submission")
+@click.option('--processes', default=1, type=click.IntRange(min=1), help="Split the parameters file between this many processes, each submitting with --concurrency threads. Default: 1")
+@click.option('--format', 'file_format', default=None, type=click.Choice(FORMATS), help="Format of the parameters file. Default: from its extension, else csv")
+@click.option('--rows', 'row_range', default=None, help="Only submit rows FIRST:LAST of the parameters file, counting from 0 and not including LAST")
+@click.option('--sample', default=None, type=click.IntRange(min=1), help="Only submit this many rows of the parameters file, chosen at random")
+@click.option('--seed', default=None, type=int, help="Random seed for --sample, to choose the same rows again on --resume")
+@click.option('--rows-per-job', default=1, type=click.IntRange(min=1), help="Pack this many rows of the parameters file into each job. Default: 1")
+def submit(ctx, name, job_definition, queue, parameters, nowait, array, manifest, concurrency, journal, resume, restart,
+           processes, file_format, row_range, sample, seed, rows_per_job):
     """
     Submit jobs to AWS Batch. Each line of the parameters file will result in a job.
-    """
-    mgr = BatchManager(yml=ctx.obj['CONFIG'])
+    Only the jobs submitted by this command are waited on.
+
+    With --array, the whole parameters file becomes array jobs of up to 10,000
+    children each. The rows are written to the --manifest file, and each child
+    job reads its own row from it; see batchbeagle.manifest.
+
+    With --concurrency N, rows are submitted from N threads that share a rate
+    limit, backing off whenever AWS throttles the submissions.
+
+    With --processes N, the parameters file is split into N line-aligned
+    byte ranges, each read and submitted by its own process.
+
+    The parameters file may be CSV or JSON Lines, either of them compressed
+    with gzip or zstd, or Parquet; see batchbeagle.params. Compressed and
+    Parquet files are streamed, so they can't be split with --processes.
+    Use --rows or --sample to submit only some of the rows.
+
+    With --rows-per-job K, every K rows become one job, which gets them all as
+    a JSON array in its "beagle_rows" parameter. The job definition's command
+    runs them with "python -m batchbeagle.pack ${beagle_rows} COMMAND...",
+    where COMMAND uses {name} for each row's parameters; see
+    batchbeagle.pack.
+
+    Every submitted row is recorded in a journal file as it goes. If a
+    submission is interrupted, rerun it with --resume to pick up where it left
+    off without submitting any row twice. The journal of an unfinished
+    submission is only replaced with --restart; once every row has been
+    submitted, the file can simply be submitted again.
+    """
+    if array and not (parameters and manifest):
+        raise click.UsageError("--array requires both --parameters and --manifest")
+    if resume and restart:
+        raise click.UsageError("Use only one of --resume and --restart")
+    if row_range and sample:
+        raise click.UsageError("Use only one of --rows and --sample")
+    if rows_per_job > 1 and (array or processes > 1):
+        raise click.UsageError("--rows-per-job can't be used with --array or --processes")
+    if row_range:
+        try:
+            first, last = [int(n) if n else None for n in row_range.split(':')]
+        except ValueError:
+            raise click.BadParameter("must look like FIRST:LAST", param_hint='--rows')
+        if any(n is not None and n < 0 for n in (first, last)):
+            raise click.BadParameter("row numbers count from 0 and can't be negative", param_hint='--rows')
+    else:
+        first = last = None
+    mgr = get_manager(ctx)
     if parameters:
-        with open(parameters) as csvfile:
-            # first line is parameter names
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                mgr.submit_job(name, job_definition, queue, parameters=row)
+        try:
+            pfile = open_parameter_file(parameters, file_format)
+            if processes > 1 and not pfile.seekable:
+                raise click.UsageError("--processes needs an uncompressed CSV or JSON Lines parameters file")
+            if processes > 1 and sample:
+                raise click.UsageError("Use only one of --processes and --sample")
+            start, end = pfile.span(first, last)
+        except ParameterFormatError as e:
+            raise click.ClickException(str(e))
+        if array:
+            rows = pfile.sample(sample, seed) if sample else pfile.rows(start, end)
+            try:
+                job_ids = mgr.submit_array_jobs(name, job_definition, queue, rows, manifest)
+            except ParameterFormatError as e:
+                raise click.ClickException(str(e))
+        else:
+            journal = SubmissionJournal(journal or parameters + '.journal')
+            header = {'name': name, 'jobDefinition': job_definition, 'queue': queue}
+            try:
+                journal.open(header, resume=resume, restart=restart)
+            except (JournalExists, JournalMismatch) as e:
+                raise click.ClickException(str(e))
+
+            def record(result):
+                if result.ok:
+                    # a packed job journals each of its rows, so a resumed
+                    # run can pack the rest differently
+                    journal.record_many(getattr(result.row, 'rows', [result.row]), result.job_id)
+
+            try:
+                if sample:
+                    rows = pfile.sample(sample, seed)
+                else:
+                    start = journal.resume_offset(pfile, start, end)
+                    rows = pfile.rows(start, end)
+                rows = journal.pending(rows)
+                if rows_per_job > 1:
+                    rows = pack_rows(rows, rows_per_job)
+                if processes > 1:
+                    report = submit_sharded(
+                        mgr,
+                        name,
+                        job_definition,
+                        queue,
+                        pfile,
+                        processes,
+                        workers=concurrency,
+                        start=start,
+                        end=end,
+                        journal=journal.filename if resume else None,
+                        callback=record,
+                        client_options=ctx.obj['CLIENT_OPTIONS'],
+                        bucket_options=ctx.obj['BUCKET_OPTIONS']
+                    )
+                else:
+                    report = mgr.submit_many(
+                        name,
+                        job_definition,
+                        queue,
+                        rows,
+                        workers=concurrency,
+                        callback=record
+                    )
+                if not report.failed:
+                    journal.finish()
+            except (JournalMismatch, ParameterFormatError, ShardFailed) as e:
+                raise click.ClickException(str(e))
+            finally:
+                journal.close()
+            for line in report.describe():
+                click.echo(line)
+            if report.failed:
+                raise click.ClickException(
+                    "{} jobs failed to submit; rerun with --resume to retry just their rows".format(report.failed)
+                )
+            # includes the jobs submitted by any run we resumed; packed jobs
+            # appear once per row
+            job_ids = sorted(set(entry['jobId'] for entry in journal.completed.values()))
     else:
-        mgr.submit_job(name, job_definition, queue)
-    while True:
-        lines, runnable_count = mgr.list_jobs(queue)
-        for line in lines:
-            click.echo(line)
-        if runnable_count == 0 or nowait:
-            break
-        time.sleep(5)
+        job_ids = [mgr.submit_job(name, job_definition, queue)]
+    wait_for_jobs(ctx, mgr, mgr.track_jobs(job_ids).poll, nowait)
+
+
+@job.command('submit-dag')
+@click.pass_context
+@click.argument('name')
+@click.argument('workflow')
+@click.argument('queue')
+@click.option('--nowait', is_flag=True, default=False, help="Do not wait for the workflow to finish")
+@click.option('--concurrency', '-c', default=8, type=click.IntRange(min=1), help="Number of jobs to submit in parallel. Default: 8")
+def submit_dag(ctx, name, workflow, queue, nowait, concurrency):
+    """
+    Submit a workflow of jobs that depend on each other to AWS Batch.
+
+    The workflow file is YAML (a list of jobs under "jobs:") or, if its name
+    ends in .csv, a CSV file with id, job_definition and depends_on columns;
+    see batchbeagle.workflow. Every job is submitted up front with its
+    dependencies, and AWS Batch starts each one when the jobs it depends on
+    have succeeded. Jobs that don't name a queue go to QUEUE.
+    """
+    mgr = get_manager(ctx)
+    try:
+        dag = Workflow.from_file(workflow, mgr.job_definitions)
+    except WorkflowError as e:
+        raise click.ClickException(str(e))
+    job_ids = mgr.submit_workflow(name, dag, queue, workers=concurrency)
+    for level in dag.levels():
+        for step in level:
+            click.echo("{}: {}".format(step.id, job_ids[step.id]))
+    wait_for_jobs(ctx, mgr, mgr.track_jobs(job_ids.values()).poll, nowait)
 
 
 @job.command()
@@ -169,7 +415,7 @@ def list(ctx, queue):
     """
     List running jobs.
     """
-    mgr = BatchManager(yml=ctx.obj['CONFIG'])
+    mgr = get_manager(ctx, read_only=True)
     lines, runnable_count = mgr.list_jobs(queue)
     for line in lines:
         click.echo(line)
@@ -177,36 +423,83 @@ def list(ctx, queue):
 @job.command()
 @click.pass_context
 @click.argument('queue')
-def cancel(ctx, queue):
+@click.option('--follow', is_flag=True, default=False, help="Keep watching after the queue has no unfinished jobs")
+@click.option('--json', 'as_json', is_flag=True, default=False, help="Print each event as a line of JSON")
+def watch(ctx, queue, follow, as_json):
+    """
+    Print each job in a queue as it changes status.
+    """
+    mgr = get_manager(ctx)
+    try:
+        for event in mgr.iter_job_events(queue=queue, stop_when_done=not follow):
+            if as_json:
+                click.echo(json.dumps(event.as_dict(), sort_keys=True))
+            else:
+                click.echo(event.describe())
+    except PollTimeout as e:
+        raise click.ClickException(str(e))
+
+def job_filter_options(func):
+    """
+    Add the options for picking which of a queue's jobs to act on.
+    """
+    options = [
+        click.option('--prefix', default=None, help="Only act on jobs whose name starts with this"),
+        click.option('--created-after', default=None, type=click.DateTime(), help="Only act on jobs created after this local time"),
+        click.option('--created-before', default=None, type=click.DateTime(), help="Only act on jobs created before this local time"),
+        click.option('--concurrency', '-c', default=8, type=click.IntRange(min=1), help="Number of jobs to act on in parallel. Default: 8"),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def job_filters(prefix, created_after, created_before):
+    """
+    Turn the ``job_filter_options`` values into ``BatchManager`` job filters.
+    """
+    def epoch_ms(dt):
+        if dt:
+            return int(time.mktime(dt.timetuple()) * 1000)
+    return {
+        'name_prefix': prefix,
+        'created_after': epoch_ms(created_after),
+        'created_before': epoch_ms(created_before),
+    }
+
+
+def report_bulk_action(verb, result):
+    count, failures = result
+    click.echo("{} {} jobs ({} failed)".format(verb, count, len(failures)))
+    for job_id, error in failures:
+        click.echo("  {}: {}".format(job_id, error), err=True)
+
+
+@job.command()
+@click.pass_context
+@click.argument('queue')
+@job_filter_options
+def cancel(ctx, queue, prefix, created_after, created_before, concurrency):
     """
-    Cancel all jobs.
+    Cancel all jobs that have not started yet.
     """
-    mgr = BatchManager(yml=ctx.obj['CONFIG'])
-    mgr.cancel_all_jobs(queue)
-    while True:
-        lines, runnable_count = mgr.list_jobs(queue)
-        for line in lines:
-            click.echo(line)
-        if runnable_count == 0:
-            break
-        time.sleep(5)
+    mgr = get_manager(ctx)
+    filters = job_filters(prefix, created_after, created_before)
+    report_bulk_action("Cancelled", mgr.cancel_all_jobs(queue, concurrency, **filters))
+    wait_for_jobs(ctx, mgr, lambda: mgr.count_jobs(queue, **filters))
 
 @job.command()
 @click.pass_context
 @click.argument('queue')
-def terminate(ctx, queue):
+@job_filter_options
+def terminate(ctx, queue, prefix, created_after, created_before, concurrency):
     """
-    Terminate all jobs.
+    Terminate all jobs, cancelling the ones that have not started yet.
     """
-    mgr = BatchManager(yml=ctx.obj['CONFIG'])
-    mgr.terminate_all_jobs(queue)
-    while True:
-        lines, runnable_count = mgr.list_jobs(queue)
-        for line in lines:
-            click.echo(line)
-        if runnable_count == 0:
-            break
-        time.sleep(5)
+    mgr = get_manager(ctx)
+    filters = job_filters(prefix, created_after, created_before)
+    report_bulk_action("Stopped", mgr.stop_all_jobs(queue, concurrency, **filters))
+    wait_for_jobs(ctx, mgr, lambda: mgr.count_jobs(queue, **filters))
 
 @job.command()
 @click.pass_context
@@ -215,7 +508,7 @@ def create(ctx, job_definition):
     """
     Create a new job definition.
     """
-    mgr = BatchManager(yml=ctx.obj['CONFIG'])
+    mgr = get_manager(ctx)
     mgr.create_job_definition(job_definition)
 
 @job.command()
@@ -225,7 +518,7 @@ def update(ctx, job_definition):
     """
     Update an existing job definition.
     """
-    mgr = BatchManager(yml=ctx.obj['CONFIG'])
+    mgr = get_manager(ctx)
     mgr.update_job_definition(job_definition)
 
 @job.command()
@@ -238,19 +531,34 @@ def deregister(ctx, job_definition):
     :param job_definition:
     :return:
     """
-    mgr = BatchManager(yml=ctx.obj['CONFIG'])
+    mgr = get_manager(ctx)
     mgr.deregister_job_definition(job_definition)
 
+@cli.command(short_help='Show what assemble would change')
+@click.pass_context
+def plan(ctx):
+    """
+    Compare every Job Definition, Job Queue and Compute Environment in a config file
+    with its live version in AWS, and show what assemble would create or update.
+    """
+    mgr = get_manager(ctx, read_only=True)
+    for line in mgr.plan().describe():
+        click.echo(line)
+
 @cli.command(short_help='Assemble all Batch resoures defined in a configuration')
 @click.pass_context
 def assemble(ctx):
     """
-    Assemble (create/update) all Job Descriptions, Job Queues and Compute Environments in a config file
+    Assemble (create/update) all Job Descriptions, Job Queues and Compute Environments in a config file.
+    Resources that already match the config are left alone; see plan.
     :param ctx:
     :return:
     """
-    mgr = BatchManager(yml=ctx.obj['CONFIG'])
-    mgr.assemble()
+    mgr = get_manager(ctx)
+    try:
+        mgr.assemble()
+    except PollTimeout as e:
+        raise click.ClickException(str(e))
 
 @cli.command(short_help='Teardown all Batch resoures defined in a configuration')
 @click.pass_context
@@ -260,8 +568,11 @@ def teardown(ctx):
     :param ctx:
     :return:
     """
-    mgr = BatchManager(yml=ctx.obj['CONFIG'])
-    mgr.teardown()
+    mgr = get_manager(ctx)
+    try:
+        mgr.teardown()
+    except PollTimeout as e:
+        raise click.ClickException(str(e))
 
 def main():
     cli(obj={})
@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+
+
+class JournalMismatch(Exception):
+    pass
+
+
+class JournalExists(Exception):
+    pass
+
+
+class SubmissionJournal(object):
+    """
+    An append-only record of which rows of a parameters file have been
+    submitted, so an interrupted ``beagle job submit`` can be resumed without
+    submitting any row twice.
+
+    The first line of the journal records what the rows were submitted as::
+
+        {"header": {"jobDefinition": "...", "name": "...", "queue": "..."}}
+
+    and each line after it is a JSON object describing one submitted
+    :py:class:`batchbeagle.params.ParameterRow`::
+
+        {"offset": 1234, "next": 1260, "hash": "...", "jobId": "..."}
+
+    Every record is flushed and fsync'd before we move on, so the journal
+    survives the process dying at any point.  Once every row has been
+    submitted, a last line marks the journal complete::
+
+        {"complete": true}
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.header = None
+        self.completed = {}
+        self.complete = False
+        self._f = None
+
+    def load(self):
+        self.header = None
+        self.completed = {}
+        self.complete = False
+        if not os.path.exists(self.filename):
+            return
+        with open(self.filename) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # a record torn by a crash mid-write; that row was never
+                    # acknowledged, so it will simply be submitted again
+                    continue
+                if 'header' in record:
+                    self.header = record['header']
+                elif 'complete' in record:
+                    self.complete = True
+                else:
+                    self.completed[record['offset']] = record
+                    # rows submitted by a later --resume
+                    self.complete = False
+
+    def open(self, header, resume=False, restart=False):
+        """
+        Open the journal for writing.  ``header`` is a dict of what the rows
+        are being submitted as: the job name, definition and queue.
+
+        If ``resume`` is ``True``, load and keep the existing records, after
+        checking they were submitted as ``header``.  Otherwise start a new
+        journal.  That overwrites a complete journal, but one left by an
+        unfinished submission only if ``restart`` is ``True``.
+        """
+        if resume:
+            self.load()
+            if self.header is not None and self.header != header:
+                raise JournalMismatch(
+                    "{} records rows submitted as {}, not {}".format(
+                        self.filename,
+                        json.dumps(self.header, sort_keys=True),
+                        json.dumps(header, sort_keys=True)
+                    )
+                )
+            self._f = open(self.filename, 'a')
+        else:
+            if not restart:
+                self.load()
+                if self.completed and not self.complete:
+                    raise JournalExists(
+                        "{} records an unfinished submission; use --resume to carry on "
+                        "from it or --restart to submit every row again".format(self.filename)
+                    )
+            self.header = None
+            self.completed = {}
+            self.complete = False
+            self._f = open(self.filename, 'w')
+        if self.header is None:
+            self.header = header
+            self._write([{'header': header}])
+
+    def finish(self):
+        """
+        Mark the journal complete, once every row has been submitted, so the
+        same parameters file can be submitted again without ``--restart``.
+        """
+        self._write([{'complete': True}])
+        self.complete = True
+
+    def close(self):
+        if self._f:
+            self._f.close()
+            self._f = None
+
+    def _check(self, row, record):
+        self._check_digest(row.offset, row.digest, record)
+
+    def _check_digest(self, offset, digest, record):
+        if record['hash'] != digest:
+            raise JournalMismatch(
+                "The row at offset {} of the parameters file has changed since it "
+                "was submitted as job {}".format(offset, record['jobId'])
+            )
+
+    def resume_offset(self, pfile, start, end=None):
+        """
+        Return the offset of the first row of ``pfile``, from offset ``start``
+        up to ``end``, after the unbroken run of completed rows at ``start``,
+        checking on the way that none of them have changed since they were
+        submitted.
+
+        For an uncompressed file we follow the chain of ``offset`` and
+        ``next`` in our records, hashing the raw bytes of each row without
+        parsing it.  Other files have to be read row by row.
+        """
+        if start is None:
+            start = pfile.data_start
+        if not pfile.seekable:
+            offset = start
+            for row in pfile.rows(start, end):
+                record = self.completed.get(row.offset)
+                if record is None:
+                    return row.offset
+                self._check(row, record)
+                offset = row.next_offset
+            return offset
+        with open(pfile.filename, 'rb') as f:
+            offset = start
+            f.seek(offset)
+            while end is None or offset < end:
+                record = self.completed.get(offset)
+                if record is None:
+                    line = f.readline()
+                    if line and not line.strip():
+                        # blank lines are never submitted, so never recorded
+                        offset += len(line)
+                        continue
+                    return offset
+                line = f.read(record['next'] - offset)
+                self._check_digest(offset, hashlib.sha256(line).hexdigest(), record)
+                offset = record['next']
+        return offset
+
+    def pending(self, rows):
+        """
+        Yield the rows in ``rows`` that have not been submitted yet.  Rows that
+        were submitted out of order by a concurrent run are skipped after
+        checking that they have not changed since.
+        """
+        for row in rows:
+            record = self.completed.get(row.offset)
+            if record is None:
+                yield row
+            else:
+                self._check(row, record)
+
+    def record(self, row, job_id):
+        self.record_many([row], job_id)
+
+    def record_many(self, rows, job_id):
+        """
+        Record that ``rows`` were all submitted as the job ``job_id``, with a
+        single fsync.
+        """
+        records = [
+            {
+                'offset': row.offset,
+                'next': row.next_offset,
+                'hash': row.digest,
+                'jobId': job_id
+            }
+            for row in rows
+        ]
+        self._write(records)
+        self.complete = False
+        for record in records:
+            self.completed[record['offset']] = record
+
+    def _write(self, records):
+        for record in records:
+            self._f.write(json.dumps(record, sort_keys=True))
+            self._f.write('\n')
+        self._f.flush()
+        os.fsync(self._f.fileno())
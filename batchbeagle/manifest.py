@@ -0,0 +1,98 @@
+"""
+Parameter manifests for array job submissions.
+
+When a parameters file is submitted with ``beagle job submit --array``, every
+row is written as one JSON object per line to a manifest file, and each array
+child job is started with these environment variables:
+
+* ``BEAGLE_MANIFEST``: the local path or ``s3://bucket/key`` URI of the manifest
+* ``BEAGLE_MANIFEST_OFFSET``: the manifest line of the array job's first child
+
+AWS Batch sets ``AWS_BATCH_JOB_ARRAY_INDEX`` in each child, so a child's row is
+line ``BEAGLE_MANIFEST_OFFSET + AWS_BATCH_JOB_ARRAY_INDEX`` of the manifest.
+Containers with ``batchbeagle`` installed can print their row as JSON with::
+
+    python -m batchbeagle.manifest
+"""
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import tempfile
+
+import boto3
+
+MANIFEST_ENV = 'BEAGLE_MANIFEST'
+MANIFEST_OFFSET_ENV = 'BEAGLE_MANIFEST_OFFSET'
+ARRAY_INDEX_ENV = 'AWS_BATCH_JOB_ARRAY_INDEX'
+
+
+def _split_s3_uri(uri):
+    bucket, _, key = uri[len('s3://'):].partition('/')
+    return bucket, key
+
+
+def write_manifest(rows, uri):
+    """
+    Write ``rows`` to the manifest at ``uri``, one JSON object per line.
+
+    :param rows: an iterable of parameter dicts
+    :param uri: a local path or an ``s3://bucket/key`` URI
+
+    :rtype: int, the number of rows written
+    """
+    count = 0
+    if uri.startswith('s3://'):
+        fd, path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+    else:
+        path = uri
+    try:
+        with open(path, 'w') as f:
+            for row in rows:
+                f.write(json.dumps(row, sort_keys=True))
+                f.write('\n')
+                count += 1
+        if uri.startswith('s3://'):
+            bucket, key = _split_s3_uri(uri)
+            boto3.client('s3').upload_file(path, bucket, key)
+    finally:
+        if path != uri:
+            os.remove(path)
+    return count
+
+
+def read_row(uri, index):
+    """
+    Return the parameter dict on line ``index`` of the manifest at ``uri``.
+    """
+    if uri.startswith('s3://'):
+        bucket, key = _split_s3_uri(uri)
+        body = boto3.client('s3').get_object(Bucket=bucket, Key=key)['Body']
+        f = tempfile.TemporaryFile(mode='w+b')
+        shutil.copyfileobj(body, f)
+        f.seek(0)
+    else:
+        f = open(uri, 'rb')
+    with f:
+        for i, line in enumerate(f):
+            if i == index:
+                return json.loads(line.decode('utf-8'))
+    raise IndexError("Manifest {} has no row {}".format(uri, index))
+
+
+def resolve_parameters(environ=None):
+    """
+    Return the parameter dict for the current array child job, as described by
+    the ``BEAGLE_MANIFEST``, ``BEAGLE_MANIFEST_OFFSET`` and
+    ``AWS_BATCH_JOB_ARRAY_INDEX`` environment variables.
+    """
+    if environ is None:
+        environ = os.environ
+    index = int(environ.get(MANIFEST_OFFSET_ENV, 0)) + int(environ.get(ARRAY_INDEX_ENV, 0))
+    return read_row(environ[MANIFEST_ENV], index)
+
+
+if __name__ == '__main__':
+    print(json.dumps(resolve_parameters(), sort_keys=True))
@@ -0,0 +1,128 @@
+"""
+Packing several rows of a parameters file into one job.
+
+When a parameters file is submitted with ``beagle job submit --rows-per-job
+K``, every K rows become a single job with one parameter, ``beagle_rows``,
+holding those rows as a JSON array of objects.  The job definition's command
+hands that parameter to ``python -m batchbeagle.pack`` along with the command
+to run for each row, using ``{name}`` where the row's value for ``name``
+should go::
+
+    job_definitions:
+      - name: job1
+        container:
+            image: centos
+            memory: 128
+            vcpus: 1
+            command: python -m batchbeagle.pack ${beagle_rows} echo {greeting} {greetee}
+
+which runs ``echo hello world``, ``echo hi there``, ... in turn, one per row,
+with ``BEAGLE_ROW_INDEX`` set to the row's position in the pack.  Every row
+is run even if one fails, and the job fails if any of them did.  Without a
+command, the rows are printed one JSON object per line instead, for
+containers that would rather read them themselves::
+
+    python -m batchbeagle.pack ${beagle_rows} | while read row; do ...; done
+
+Containers without ``batchbeagle`` installed can simply parse the JSON
+themselves.  AWS limits the size of a job submission, so very wide rows need
+a smaller K.
+"""
+from __future__ import print_function
+
+import hashlib
+import itertools
+import json
+import os
+import re
+import subprocess
+import sys
+
+PACKED_ROWS_PARAMETER = 'beagle_rows'
+ROW_INDEX_ENV = 'BEAGLE_ROW_INDEX'
+
+PLACEHOLDER_RE = re.compile(r'\{(\w+)\}')
+
+
+class RowPack(dict):
+    """
+    The parameters for one job that runs several
+    :py:class:`batchbeagle.params.ParameterRow` objects.  It spans the file
+    from the ``offset`` of its first row to the ``next_offset`` of its last,
+    and its ``digest`` is a hash of theirs.
+    """
+
+    def __init__(self, rows):
+        super(RowPack, self).__init__({
+            PACKED_ROWS_PARAMETER: json.dumps([dict(row) for row in rows], sort_keys=True, separators=(',', ':'))
+        })
+        self.rows = rows
+        self.offset = rows[0].offset
+        self.next_offset = rows[-1].next_offset
+        self.digest = hashlib.sha256(''.join(row.digest for row in rows).encode('utf-8')).hexdigest()
+
+
+def pack_rows(rows, size):
+    """
+    Yield a :py:class:`RowPack` for every ``size`` rows of ``rows``; the last
+    may hold fewer.
+    """
+    rows = iter(rows)
+    while True:
+        pack = list(itertools.islice(rows, size))
+        if not pack:
+            return
+        yield RowPack(pack)
+
+
+def fill(args, row):
+    """
+    Replace each ``{name}`` in ``args`` with the value of ``name`` in ``row``.
+    Braces around anything else are left alone.
+    """
+    def replace(match):
+        return row.get(match.group(1), match.group(0))
+    return [PLACEHOLDER_RE.sub(replace, arg) for arg in args]
+
+
+def run_rows(rows, args):
+    """
+    Run the command ``args`` once per row in ``rows``, filled in from it.
+
+    :rtype: int, the number of rows whose command failed
+    """
+    failed = 0
+    for i, row in enumerate(rows):
+        environ = dict(os.environ)
+        environ[ROW_INDEX_ENV] = str(i)
+        if subprocess.call(fill(args, row), env=environ) != 0:
+            failed += 1
+    return failed
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if not argv:
+        print("usage: python -m batchbeagle.pack ROWS [COMMAND [ARG ...]]", file=sys.stderr)
+        return 2
+    try:
+        rows = json.loads(argv[0])
+    except ValueError:
+        print("ROWS is not a JSON array; is ${{{}}} in the job definition's command?".format(
+            PACKED_ROWS_PARAMETER
+        ), file=sys.stderr)
+        return 2
+    if len(argv) == 1:
+        for row in rows:
+            print(json.dumps(row, sort_keys=True))
+        return 0
+    failed = run_rows(rows, argv[1:])
+    if failed:
+        print("{} of {} rows failed".format(failed, len(rows)), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
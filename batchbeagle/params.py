@@ -0,0 +1,412 @@
+import array
+import csv
+import gzip
+import hashlib
+import io
+import json
+import mmap
+import os
+import random
+
+
+class ParameterFormatError(Exception):
+    pass
+
+
+#: The parameter file formats we can read, for ``--format``
+FORMATS = ('csv', 'csv.gz', 'csv.zst', 'jsonl', 'jsonl.gz', 'jsonl.zst', 'parquet')
+
+EXTENSIONS = {
+    '.csv': 'csv',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+}
+
+COMPRESSIONS = {
+    '.gz': 'gz',
+    '.zst': 'zst',
+}
+
+
+def parameter_string(value):
+    """
+    Batch parameters are strings; turn a value read from JSON Lines,
+    Parquet or YAML into one.
+    """
+    if value is None:
+        return u''
+    if isinstance(value, (bool, dict, list)):
+        return json.dumps(value)
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return value if isinstance(value, type(u'')) else u'{}'.format(value)
+
+
+class ParameterRow(dict):
+    """
+    The parameters for one job, as read from a line of a parameters file.
+
+    Besides the parameter names and values, we remember where the line lives
+    in the file so that submissions can be journaled and resumed:
+
+    * ``offset``: the byte offset of the start of the line
+    * ``next_offset``: the byte offset of the line after it
+    * ``digest``: a hash of the raw bytes of the line
+
+    For files we can't seek in (compressed or Parquet files), ``offset`` is
+    the row number instead, counting from 0, and ``next_offset`` is one more.
+    """
+
+    def __init__(self, parameters, offset, next_offset, digest):
+        super(ParameterRow, self).__init__(parameters)
+        self.offset = offset
+        self.next_offset = next_offset
+        self.digest = digest
+
+
+class LineIndex(object):
+    """
+    The byte offset of the start of every line of a file from byte ``start``
+    on, found by scanning a read-only mmap of the file once.  Line ``n`` of
+    the index can then be read with a single seek.
+    """
+
+    def __init__(self, filename, start=0):
+        try:
+            self.offsets = array.array('Q')
+        except ValueError:
+            # Python 2 has no unsigned long long arrays
+            self.offsets = array.array('L')
+        with open(filename, 'rb') as f:
+            self.end = os.fstat(f.fileno()).st_size
+            if self.end <= start:
+                return
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                offset = start
+                while offset < self.end:
+                    self.offsets.append(offset)
+                    newline = m.find(b'\n', offset)
+                    if newline < 0:
+                        break
+                    offset = newline + 1
+            finally:
+                m.close()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, n):
+        return self.offsets[n]
+
+    def span(self, first=None, last=None):
+        """
+        :rtype: the ``(start, end)`` byte offsets of lines ``first`` up to but
+                not including ``last``
+        """
+        first = 0 if first is None else min(first, len(self))
+        last = len(self) if last is None else max(min(last, len(self)), first)
+        start = self.offsets[first] if first < len(self) else self.end
+        end = self.offsets[last] if last < len(self) else self.end
+        return start, end
+
+
+class ParameterSource(object):
+    """
+    The behaviour shared by every kind of parameters file.  Here ``start``
+    and ``end`` are row numbers, which is all a file we can only read from
+    the beginning can offer.
+
+    Subclasses provide ``_iter_rows(start)``, which yields a ``(row number,
+    parameters, digest)`` tuple for every row from row number ``start`` on,
+    in order, leaving out blank rows.
+    """
+
+    #: whether offsets are byte offsets we can seek to, so the file can be
+    #: split between processes with ``shards()``
+    seekable = False
+    data_start = 0
+
+    def rows(self, start=None, end=None):
+        """
+        Yield a :py:class:`ParameterRow` for every row of the file from row
+        ``start`` (the first by default) up to but not including row ``end``
+        (the end of the file by default).
+        """
+        for n, parameters, digest in self._iter_rows(start or 0):
+            if end is not None and n >= end:
+                return
+            yield ParameterRow(parameters, n, n + 1, digest)
+
+    def span(self, first=None, last=None):
+        """
+        :rtype: the ``(start, end)`` offsets to give ``rows()`` to read rows
+                ``first`` up to but not including ``last``, counting from 0
+        """
+        return (first or 0), last
+
+    def sample(self, count, seed=None):
+        """
+        Yield ``count`` rows chosen at random, in file order.  We can only read
+        the file from the beginning, so this reads all of it, keeping a
+        reservoir of ``count`` rows.
+        """
+        chosen = random.Random(seed)
+        reservoir = []
+        for i, row in enumerate(self.rows()):
+            if i < count:
+                reservoir.append(row)
+            else:
+                j = chosen.randint(0, i)
+                if j < count:
+                    reservoir[j] = row
+        for row in sorted(reservoir, key=lambda row: row.offset):
+            yield row
+
+    def __iter__(self):
+        return self.rows()
+
+
+class ParameterFile(ParameterSource):
+    """
+    Reads a CSV parameters file whose first line holds the parameter names,
+    optionally compressed with gzip (``compression='gz'``) or zstd
+    (``compression='zst'``, which needs the ``zstandard`` package).
+
+    Unlike ``csv.DictReader``, we read the file a line at a time in binary so
+    we know the byte offset of every row and can start reading from any row
+    boundary.  Quoted values therefore cannot span lines.  Compressed files
+    are streamed instead, and their rows are numbered rather than located by
+    byte offset.
+    """
+
+    header = True
+
+    def __init__(self, filename, compression=None):
+        self.filename = filename
+        self.compression = compression
+        self.seekable = compression is None
+        self.fieldnames = None
+        self.__index = None
+        with self._open() as f:
+            if self.header:
+                header = f.readline()
+                self.fieldnames = self._parse(header)
+                if self.seekable:
+                    self.data_start = f.tell()
+
+    def _open(self):
+        if self.compression is None:
+            return open(self.filename, 'rb')
+        if self.compression == 'gz':
+            return gzip.open(self.filename, 'rb')
+        if self.compression == 'zst':
+            try:
+                import zstandard
+            except ImportError:
+                raise ParameterFormatError(
+                    "Reading {} needs the zstandard package: pip install batchbeagle[zstd]".format(self.filename)
+                )
+            f = open(self.filename, 'rb')
+            # the stream reader can't readline() by itself
+            return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(f, closefd=True))
+        raise ParameterFormatError("Unknown compression: {}".format(self.compression))
+
+    def _parse(self, line):
+        return next(csv.reader([line.decode('utf-8').rstrip('\r\n')]))
+
+    def _parameters(self, line, offset):
+        values = self._parse(line)
+        if len(values) != len(self.fieldnames):
+            raise ParameterFormatError("{}: the row at offset {} has {} values, but the header names {}".format(
+                self.filename, offset, len(values), len(self.fieldnames)
+            ))
+        return zip(self.fieldnames, values)
+
+    def _row(self, line, offset, next_offset):
+        return ParameterRow(self._parameters(line, offset), offset, next_offset, hashlib.sha256(line).hexdigest())
+
+    def rows(self, start=None, end=None):
+        """
+        Yield a :py:class:`ParameterRow` for every line of the file, starting
+        at byte offset ``start`` (the first line after the header by default)
+        and stopping before the line that starts at or after ``end`` (the end
+        of the file by default).  Blank lines are skipped.
+
+        For compressed files, ``start`` and ``end`` are row numbers instead.
+        """
+        if not self.seekable:
+            for row in super(ParameterFile, self).rows(start, end):
+                yield row
+            return
+        if start is None:
+            start = self.data_start
+        with open(self.filename, 'rb') as f:
+            f.seek(start)
+            offset = start
+            for line in iter(f.readline, b''):
+                if end is not None and offset >= end:
+                    break
+                next_offset = offset + len(line)
+                if line.strip():
+                    yield self._row(line, offset, next_offset)
+                offset = next_offset
+
+    def _iter_rows(self, start):
+        with self._open() as f:
+            if self.header:
+                f.readline()
+            for n, line in enumerate(iter(f.readline, b'')):
+                if n >= start and line.strip():
+                    yield n, self._parameters(line, n), hashlib.sha256(line).hexdigest()
+
+    def index(self):
+        """
+        :rtype: the :py:class:`LineIndex` of the rows of the file, built on
+                first use
+        """
+        if not self.seekable:
+            raise ParameterFormatError("{} is compressed, so its rows can't be indexed".format(self.filename))
+        if self.__index is None:
+            self.__index = LineIndex(self.filename, self.data_start)
+        return self.__index
+
+    def span(self, first=None, last=None):
+        """
+        :rtype: the ``(start, end)`` offsets to give ``rows()`` to read rows
+                ``first`` up to but not including ``last``, counting from 0
+                and including blank lines
+        """
+        if not self.seekable:
+            return super(ParameterFile, self).span(first, last)
+        if first is None and last is None:
+            return self.data_start, None
+        return self.index().span(first, last)
+
+    def sample(self, count, seed=None):
+        """
+        Yield ``count`` rows chosen at random, in file order.  Blank lines may
+        be chosen, and are skipped, so this may yield fewer.
+        """
+        if not self.seekable:
+            for row in super(ParameterFile, self).sample(count, seed):
+                yield row
+            return
+        index = self.index()
+        chosen = sorted(random.Random(seed).sample(range(len(index)), min(count, len(index))))
+        with open(self.filename, 'rb') as f:
+            for n in chosen:
+                f.seek(index[n])
+                line = f.readline()
+                if line.strip():
+                    yield self._row(line, index[n], index[n] + len(line))
+
+    def shards(self, count, start=None, end=None):
+        """
+        Split the file from byte offset ``start`` (the first line after the
+        header by default) to byte offset ``end`` (the end of the file by
+        default) into up to ``count`` byte ranges of about the same size, each
+        starting at the beginning of a line.
+
+        :rtype: list of ``(start, end)`` tuples for ``rows()``
+        """
+        if not self.seekable:
+            raise ParameterFormatError("{} is compressed, so it can't be split into shards".format(self.filename))
+        if start is None:
+            start = self.data_start
+        if end is None:
+            end = os.path.getsize(self.filename)
+        bounds = [start]
+        with open(self.filename, 'rb') as f:
+            for i in range(1, count):
+                # Back up one byte so that landing exactly on the start of a
+                # line keeps that line in this shard
+                f.seek(start + (end - start) * i // count - 1)
+                f.readline()
+                bounds.append(min(max(f.tell(), bounds[-1]), end))
+        bounds.append(end)
+        return [(first, last) for first, last in zip(bounds, bounds[1:]) if first < last]
+
+
+class JSONLinesParameterFile(ParameterFile):
+    """
+    Reads a JSON Lines parameters file: one JSON object of parameter names
+    and values per line, with no header.  Values that aren't strings are
+    passed to the job as JSON.
+    """
+
+    header = False
+
+    def _parameters(self, line, offset):
+        parameters = json.loads(line.decode('utf-8'))
+        if not isinstance(parameters, dict):
+            raise ParameterFormatError("{}: the row at offset {} is not a JSON object: {}".format(
+                self.filename, offset, line.strip()
+            ))
+        return [(name, parameter_string(value)) for name, value in parameters.items()]
+
+
+class ParquetParameterFile(ParameterSource):
+    """
+    Reads a Parquet parameters file, one row group at a time, with
+    ``pyarrow``.  Each column is a parameter.  Rows are numbered, and a row's
+    digest is a hash of its values, since there are no raw bytes to hash.
+    """
+
+    BATCH_SIZE = 10000
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.fieldnames = self._open().schema_arrow.names
+
+    def _open(self):
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            raise ParameterFormatError(
+                "Reading {} needs the pyarrow package: pip install batchbeagle[parquet]".format(self.filename)
+            )
+        return pyarrow.parquet.ParquetFile(self.filename)
+
+    def _iter_rows(self, start):
+        n = 0
+        for batch in self._open().iter_batches(batch_size=self.BATCH_SIZE):
+            if n + batch.num_rows <= start:
+                # skip whole batches before the start without converting them
+                n += batch.num_rows
+                continue
+            for values in batch.to_pylist():
+                if n >= start:
+                    parameters = [(name, parameter_string(value)) for name, value in values.items()]
+                    yield n, parameters, hashlib.sha256(json.dumps(parameters).encode('utf-8')).hexdigest()
+                n += 1
+
+
+def open_parameter_file(filename, format=None):
+    """
+    Open the parameters file ``filename`` with the reader for ``format``, one
+    of ``FORMATS``.  By default the format comes from the file's extensions,
+    e.g. ``sweep.jsonl.gz``, and files we don't recognize are read as CSV.
+
+    :rtype: a :py:class:`ParameterSource`
+    """
+    if format is None:
+        root, extension = os.path.splitext(filename.lower())
+        compression = COMPRESSIONS.get(extension)
+        if compression:
+            root, extension = os.path.splitext(root)
+        format = EXTENSIONS.get(extension, 'csv')
+    else:
+        if format not in FORMATS:
+            raise ParameterFormatError("Unknown parameters file format: {}".format(format))
+        format, _, compression = format.partition('.')
+        compression = compression or None
+    if format == 'parquet':
+        if compression:
+            raise ParameterFormatError("Parquet files do their own compression: {}".format(filename))
+        return ParquetParameterFile(filename)
+    if format == 'jsonl':
+        return JSONLinesParameterFile(filename, compression)
+    return ParameterFile(filename, compression)
@@ -0,0 +1,83 @@
+import random
+import time
+
+
+class PollTimeout(Exception):
+    pass
+
+
+class Poller(object):
+    """
+    Repeatedly checks on something until it is done, backing off
+    exponentially between checks while nothing changes.
+
+    The delay between checks starts at ``floor`` seconds and is multiplied by
+    ``factor`` after every check, up to ``ceiling`` seconds.  Whenever a check
+    returns a different state than the one before it, things are moving, so the
+    delay drops back to ``floor``.  Each delay is randomly stretched or shrunk
+    by up to ``jitter`` (a fraction) so that many pollers don't fall into step.
+
+    If ``timeout`` is set, ``wait()`` gives up with :py:class:`PollTimeout`
+    after that many seconds.
+    """
+
+    def __init__(self, floor=1.0, ceiling=30.0, factor=2.0, jitter=0.2, timeout=None):
+        self.floor = float(floor)
+        self.ceiling = max(float(ceiling), self.floor)
+        self.factor = float(factor)
+        self.jitter = float(jitter)
+        self.timeout = timeout
+        self.slept = 0.0
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+        self.slept += seconds
+
+    def wait(self, check, until=bool):
+        """
+        Call ``check()`` until ``until(state)`` is true of the state it
+        returns, sleeping between calls, and return that final state.
+        """
+        for state in self.states(check):
+            if until(state):
+                return state
+
+    def states(self, check):
+        """
+        Call ``check()`` over and over, sleeping between calls, and yield
+        each state it returns.
+        """
+        pace = self._pacer()
+        while True:
+            state = check()
+            yield state
+            self.sleep(pace(state))
+
+    def _pacer(self):
+        """
+        Start the clock on one wait loop.
+
+        :rtype: a function that takes each state the loop sees and returns how
+                many seconds to sleep before the next check, raising
+                :py:class:`PollTimeout` once the loop has run out of time
+        """
+        deadline = None
+        if self.timeout:
+            deadline = time.time() + self.timeout
+        loop = {'delay': self.floor, 'previous': None, 'first': True}
+
+        def pace(state):
+            if not loop['first'] and state != loop['previous']:
+                loop['delay'] = self.floor
+            loop['first'] = False
+            loop['previous'] = state
+            seconds = loop['delay'] * (1 + random.uniform(-self.jitter, self.jitter))
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise PollTimeout("Gave up waiting after {} seconds".format(self.timeout))
+                seconds = min(seconds, remaining)
+            loop['delay'] = min(self.ceiling, loop['delay'] * self.factor)
+            return seconds
+
+        return pace
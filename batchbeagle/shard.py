@@ -0,0 +1,132 @@
+import multiprocessing
+import traceback
+
+try:
+    from queue import Empty
+except ImportError:
+    from Queue import Empty
+
+from batchbeagle.aws.batch import BatchManager, SubmitReport, SubmitResult
+from batchbeagle.aws.client import make_batch_client
+from batchbeagle.aws.throttle import SharedTokenBucket
+from batchbeagle.journal import SubmissionJournal
+from batchbeagle.params import ParameterRow
+
+
+class ShardFailed(Exception):
+    pass
+
+
+def _submit_shard(results, shard, yml, client_options, bucket_options, name, job_definition, queue,
+                  reader, filename, start, end, workers, journal):
+    """
+    The body of one worker process: submit the rows of ``filename``, read
+    with the parameters file class ``reader``, between byte offsets ``start``
+    and ``end`` with our own Batch client, and send every outcome back to the
+    parent through the ``results`` queue.
+    """
+    try:
+        bucket = SharedTokenBucket(**bucket_options) if bucket_options else None
+        mgr = BatchManager(yml=yml, batch=make_batch_client(bucket=bucket, **client_options))
+        rows = reader(filename).rows(start, end)
+        if journal:
+            # rows that a run we are resuming already submitted
+            done = SubmissionJournal(journal)
+            done.load()
+            rows = done.pending(rows)
+
+        def send(result):
+            results.put((
+                'result',
+                dict(result.row),
+                result.row.offset,
+                result.row.next_offset,
+                result.row.digest,
+                result.job_id,
+                str(result.error) if result.error else None
+            ))
+
+        mgr.submit_many(name, job_definition, queue, rows, workers=workers, callback=send)
+    except Exception:
+        results.put(('failed', shard, traceback.format_exc()))
+    else:
+        results.put(('done', shard, None))
+
+
+def submit_sharded(mgr, name, job_definition, queue, pfile, processes, workers=1, start=None, end=None,
+                   journal=None, callback=None, client_options=None, bucket_options=None):
+    """
+    Submit one job per row of the :py:class:`batchbeagle.params.ParameterFile`
+    ``pfile``, which must be ``seekable``, from ``processes`` worker
+    processes, each with its own Batch client and ``workers`` threads.  The
+    file is split into line-aligned byte ranges (see
+    :py:meth:`batchbeagle.params.ParameterFile.shards`), one per process, so
+    no process reads more of it than its own share.
+
+    Results come back to this process as they happen: ``callback`` is called
+    here with each :py:class:`batchbeagle.aws.batch.SubmitResult`, whose
+    ``index`` is the byte offset of its row.
+
+    :param mgr: the parent's :py:class:`BatchManager`; we register the job
+                definition through it before starting any workers, so they
+                all find and reuse the same revision
+    :param start: the byte offset to start at (the first row by default)
+    :param end: the byte offset to stop at (the end of the file by default)
+    :param journal: the path of a journal of rows to skip, if resuming
+    :param client_options: keyword arguments for ``make_batch_client()`` in the workers
+    :param bucket_options: keyword arguments for a ``SharedTokenBucket`` in the workers
+
+    :rtype: :py:class:`batchbeagle.aws.batch.SubmitReport`
+    """
+    mgr.job_definitions[job_definition].register()
+    report = SubmitReport()
+    results = multiprocessing.Queue()
+    shards = pfile.shards(processes, start, end)
+    procs = [
+        multiprocessing.Process(
+            target=_submit_shard,
+            args=(results, i, mgr.yml, client_options or {}, bucket_options, name, job_definition, queue,
+                  type(pfile), pfile.filename, first, last, workers, journal)
+        )
+        for i, (first, last) in enumerate(shards)
+    ]
+    for proc in procs:
+        proc.start()
+    failures = []
+    finished = 0
+    try:
+        while finished < len(procs):
+            try:
+                message = results.get(timeout=1)
+            except Empty:
+                if not any(proc.is_alive() for proc in procs):
+                    # a worker died without telling us; look one last time
+                    try:
+                        message = results.get(timeout=1)
+                    except Empty:
+                        failures.append("{} worker(s) exited without finishing".format(len(procs) - finished))
+                        break
+                else:
+                    continue
+            if message[0] == 'result':
+                params, offset, next_offset, digest, job_id, error = message[1:]
+                row = ParameterRow(params, offset, next_offset, digest)
+                result = SubmitResult(offset, row, job_id=job_id, error=error)
+                report.add(result)
+                if callback:
+                    callback(result)
+            else:
+                finished += 1
+                if message[0] == 'failed':
+                    failures.append("shard {}: {}".format(message[1], message[2]))
+    except BaseException:
+        for proc in procs:
+            proc.terminate()
+        raise
+    finally:
+        for proc in procs:
+            proc.join()
+    report.finish()
+    if failures:
+        raise ShardFailed("\n".join(failures))
+    return report
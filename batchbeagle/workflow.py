@@ -0,0 +1,251 @@
+import csv
+
+import yaml
+
+from batchbeagle.config import SafeLoader
+from batchbeagle.params import parameter_string
+
+
+class WorkflowError(Exception):
+    pass
+
+
+class Dependency(object):
+    """
+    One edge of a workflow: the step that has it waits for step ``on``.
+
+    ``type`` is ``None`` for an ordinary dependency, where the whole step waits
+    for the whole of ``on``, or ``N_TO_N`` for two array steps of the same
+    size, where child *i* waits only for child *i* of ``on``.
+    """
+
+    TYPES = (None, 'N_TO_N')
+
+    def __init__(self, on, type=None):
+        if type not in self.TYPES:
+            raise WorkflowError("Unknown dependency type {!r} on {}".format(type, on))
+        self.on = on
+        self.type = type
+
+    @classmethod
+    def parse(cls, value):
+        """
+        Read a dependency written either as ``{'id': ..., 'type': ...}`` or as
+        a string: ``step`` or ``step:N_TO_N``.
+        """
+        if isinstance(value, dict):
+            return cls(str(value['id']), value.get('type'))
+        on, _, type = str(value).partition(':')
+        return cls(on.strip(), type.strip() or None)
+
+    def render(self, job_id):
+        depends_on = {'jobId': job_id}
+        if self.type:
+            depends_on['type'] = self.type
+        return depends_on
+
+
+class Step(object):
+    """
+    One job of a workflow.
+
+    ``sequential`` only applies to array steps: it makes each child wait for
+    the child before it, so the children run one at a time in index order.
+    """
+
+    def __init__(self, id, job_definition, queue=None, parameters=None, depends_on=None,
+                 array_size=None, sequential=False):
+        self.id = id
+        self.job_definition = job_definition
+        self.queue = queue
+        self.parameters = parameters or {}
+        self.depends_on = depends_on or []
+        self.array_size = array_size
+        self.sequential = sequential
+
+    def render_depends_on(self, job_ids):
+        """
+        :param job_ids: a dict of step id to the job id it was submitted as
+
+        :rtype: the ``dependsOn`` list for ``submit_job()``
+        """
+        depends_on = [dependency.render(job_ids[dependency.on]) for dependency in self.depends_on]
+        if self.sequential:
+            depends_on.append({'type': 'SEQUENTIAL'})
+        return depends_on
+
+
+class Workflow(object):
+    """
+    A set of jobs with dependencies between them, read from a workflow file.
+
+    A YAML workflow file lists its steps under ``jobs:``::
+
+        jobs:
+          - id: extract
+            job_definition: extract
+            array_size: 100
+          - id: transform
+            job_definition: transform
+            array_size: 100
+            depends_on:
+              - extract:N_TO_N
+          - id: load
+            job_definition: load
+            queue: bigqueue
+            parameters:
+              table: results
+            depends_on: [transform]
+
+    A CSV workflow file has one step per line and ``id``, ``job_definition``
+    and ``depends_on`` columns (dependencies separated by spaces).  The
+    ``queue``, ``array_size`` and ``sequential`` columns are optional, and
+    every other column is a parameter of the job.
+
+    Steps without a ``queue`` go to the queue the workflow is submitted to.
+    """
+
+    # the most jobs AWS Batch lets a job depend on
+    MAX_DEPENDENCIES = 20
+    # the sizes AWS Batch allows an array job
+    MIN_ARRAY_SIZE = 2
+    MAX_ARRAY_SIZE = 10000
+    STEP_KEYS = ('id', 'job_definition', 'queue', 'depends_on', 'array_size', 'sequential')
+
+    def __init__(self, steps, job_definitions=None):
+        """
+        :param job_definitions: if given, the names of the job definitions in
+                                the config, which every step must use one of
+        """
+        self.steps = dict((step.id, step) for step in steps)
+        if len(self.steps) != len(steps):
+            raise WorkflowError("Workflow step ids must be unique")
+        self.job_definitions = job_definitions
+        self.validate()
+
+    @classmethod
+    def from_file(cls, filename, job_definitions=None):
+        if filename.endswith('.csv'):
+            return cls.from_csv(filename, job_definitions)
+        return cls.from_yaml(filename, job_definitions)
+
+    @classmethod
+    def from_yaml(cls, filename, job_definitions=None):
+        try:
+            with open(filename) as f:
+                yml = yaml.load(f, Loader=SafeLoader)
+        except (IOError, OSError, yaml.YAMLError) as e:
+            raise WorkflowError("Can't read workflow {}: {}".format(filename, e))
+        if not isinstance(yml, dict) or not isinstance(yml.get('jobs'), list):
+            raise WorkflowError("Workflow {} must list its steps under \"jobs:\"".format(filename))
+        steps = []
+        for n, job in enumerate(yml['jobs']):
+            if not isinstance(job, dict):
+                raise WorkflowError("Step {} of workflow {} is not a mapping".format(n + 1, filename))
+            step_id = str(cls._required(job, 'id', "Step {} of workflow {}".format(n + 1, filename)))
+            depends_on = job.get('depends_on', job.get('dependsOn', []))
+            if not isinstance(depends_on, list):
+                depends_on = [depends_on]
+            parameters = job.get('parameters') or {}
+            if not isinstance(parameters, dict):
+                raise WorkflowError("Step {} has parameters that are not a mapping".format(step_id))
+            steps.append(Step(
+                step_id,
+                cls._required(job, 'job_definition', "Step {}".format(step_id)),
+                queue=job.get('queue'),
+                parameters=dict((str(name), parameter_string(value)) for name, value in parameters.items()),
+                depends_on=cls._dependencies(step_id, depends_on),
+                array_size=job.get('array_size'),
+                sequential=job.get('sequential', False)
+            ))
+        return cls(steps, job_definitions)
+
+    @classmethod
+    def from_csv(cls, filename, job_definitions=None):
+        steps = []
+        try:
+            with open(filename) as f:
+                for n, row in enumerate(csv.DictReader(f)):
+                    step_id = cls._required(row, 'id', "Line {} of workflow {}".format(n + 2, filename))
+                    steps.append(Step(
+                        step_id,
+                        cls._required(row, 'job_definition', "Step {}".format(step_id)),
+                        queue=row.get('queue') or None,
+                        parameters=dict((k, v) for k, v in row.items() if k not in cls.STEP_KEYS),
+                        depends_on=cls._dependencies(step_id, (row.get('depends_on') or '').split()),
+                        array_size=cls._int(row, 'array_size'),
+                        sequential=(row.get('sequential') or '').lower() in ('1', 'true', 'yes')
+                    ))
+        except (IOError, OSError, csv.Error) as e:
+            raise WorkflowError("Can't read workflow {}: {}".format(filename, e))
+        return cls(steps, job_definitions)
+
+    @staticmethod
+    def _required(job, key, where):
+        if job.get(key) in (None, ''):
+            raise WorkflowError("{} has no {}".format(where, key))
+        return job[key]
+
+    @staticmethod
+    def _dependencies(step_id, values):
+        try:
+            return [Dependency.parse(value) for value in values]
+        except KeyError:
+            raise WorkflowError("Step {} has a dependency with no id".format(step_id))
+
+    @staticmethod
+    def _int(row, key):
+        if not row.get(key):
+            return None
+        try:
+            return int(row[key])
+        except ValueError:
+            raise WorkflowError("Step {} has {} {!r}, which is not a number".format(row.get('id'), key, row[key]))
+
+    def validate(self):
+        for step in self.steps.values():
+            if self.job_definitions is not None and step.job_definition not in self.job_definitions:
+                raise WorkflowError("Step {} uses job definition {}, which is not in the config".format(
+                    step.id, step.job_definition
+                ))
+            if step.array_size is not None and (
+                    isinstance(step.array_size, bool) or not isinstance(step.array_size, int) or
+                    not self.MIN_ARRAY_SIZE <= step.array_size <= self.MAX_ARRAY_SIZE):
+                raise WorkflowError("Step {} has array_size {!r}, but it must be a whole number from {} to {}".format(
+                    step.id, step.array_size, self.MIN_ARRAY_SIZE, self.MAX_ARRAY_SIZE
+                ))
+            if len(step.depends_on) + int(step.sequential) > self.MAX_DEPENDENCIES:
+                raise WorkflowError("Step {} has more than {} dependencies".format(step.id, self.MAX_DEPENDENCIES))
+            if step.sequential and not step.array_size:
+                raise WorkflowError("Step {} is sequential but not an array job".format(step.id))
+            for dependency in step.depends_on:
+                if dependency.on not in self.steps:
+                    raise WorkflowError("Step {} depends on unknown step {}".format(step.id, dependency.on))
+                if dependency.type == 'N_TO_N' and (
+                        not step.array_size or step.array_size != self.steps[dependency.on].array_size):
+                    raise WorkflowError(
+                        "Step {} has an N_TO_N dependency on {}, but they are not array jobs "
+                        "of the same size".format(step.id, dependency.on)
+                    )
+        self.levels()
+
+    def levels(self):
+        """
+        Sort the steps topologically into levels: every step depends only on
+        steps in earlier levels, so the steps of a level can all be submitted
+        at once.
+
+        :rtype: list of lists of :py:class:`Step`
+        """
+        remaining = dict((step_id, set(d.on for d in step.depends_on)) for step_id, step in self.steps.items())
+        levels = []
+        while remaining:
+            ready = sorted(step_id for step_id, waiting_on in remaining.items() if not waiting_on)
+            if not ready:
+                raise WorkflowError("Workflow has a dependency cycle among: {}".format(", ".join(sorted(remaining))))
+            levels.append([self.steps[step_id] for step_id in ready])
+            for step_id in ready:
+                del remaining[step_id]
+            for waiting_on in remaining.values():
+                waiting_on.difference_update(ready)
+        return levels
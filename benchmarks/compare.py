@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""
+Compare two result files written by ``benchmarks/run.py``::
+
+    python benchmarks/compare.py before.json after.json
+"""
+from __future__ import print_function
+
+import json
+
+import click
+
+
+def load(filename):
+    with open(filename) as f:
+        results = json.load(f)
+    return results, dict(((r['benchmark'], r['size']), r) for r in results['results'])
+
+
+@click.command()
+@click.argument('before')
+@click.argument('after')
+@click.option('--threshold', default=0.1, type=float, help="Flag changes bigger than this fraction. Default: 0.1")
+def main(before, after, threshold):
+    """
+    Print the change in wall-clock time and API calls of every benchmark
+    that appears in both BEFORE and AFTER.
+    """
+    before_run, before_results = load(before)
+    after_run, after_results = load(after)
+    print("before: {} ({})".format(before_run.get('commit'), before))
+    print("after:  {} ({})".format(after_run.get('commit'), after))
+    print("{:<24} {:>8} {:>10} {:>10} {:>8} {:>7} {:>7}".format(
+        'benchmark', 'size', 'before', 'after', 'change', 'calls', 'calls'
+    ))
+    for key in sorted(before_results):
+        if key not in after_results:
+            continue
+        old, new = before_results[key], after_results[key]
+        change = (new['seconds'] - old['seconds']) / old['seconds'] if old['seconds'] else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '  slower'
+        elif change < -threshold:
+            flag = '  faster'
+        print("{:<24} {:>8} {:>9.3f}s {:>9.3f}s {:>+7.0%} {:>7} {:>7}{}".format(
+            key[0], key[1], old['seconds'], new['seconds'], change,
+            sum(old['calls'].values()), sum(new['calls'].values()), flag
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+"""
+Benchmarks for batchbeagle, run against the in-memory Batch stand-in in
+:py:mod:`stand_in` so they need no AWS account and no network.
+
+Run from the top of the repository::
+
+    python benchmarks/run.py --output before.json
+    # ... change things ...
+    python benchmarks/run.py --output after.json
+    python benchmarks/compare.py before.json after.json
+
+Each benchmark records its wall-clock time and the number of API calls of
+each kind it made.  ``--latency`` sets the simulated round trip of every
+call; ``--quick`` only runs the smallest size of each benchmark.
+"""
+from __future__ import print_function
+
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batchbeagle.aws.batch import BatchManager  # noqa: E402
+from batchbeagle.aws.throttle import AdaptiveRateLimiter  # noqa: E402
+from batchbeagle.params import ParameterFile  # noqa: E402
+from batchbeagle.poll import Poller  # noqa: E402
+from stand_in import LocalBatch  # noqa: E402
+
+
+def compute_environment_yml(name):
+    return {
+        'name': name,
+        'type': 'managed',
+        'state': 'enabled',
+        'serviceRole': 'arn:aws:iam::123456789012:role/service-role/AWSBatchServiceRole',
+        'compute_resources': {
+            'type': 'ec2',
+            'instanceRole': 'arn:aws:iam::123456789012:instance-profile/ecsInstanceRole',
+            'instanceTypes': ['optimal'],
+            'maxvCpus': 16,
+            'minvCpus': 0,
+            'securityGroupIds': ['sg-ffffffff'],
+            'subnets': ['subnet-9f9f9f'],
+        },
+    }
+
+
+def config_yml(size):
+    """
+    A config with ``size`` each of compute environments, queues and job
+    definitions.
+    """
+    return {
+        'compute_environments': [compute_environment_yml('env{}'.format(i)) for i in range(size)],
+        'queues': [
+            {
+                'name': 'queue{}'.format(i),
+                'state': 'enabled',
+                'priority': 1,
+                'compute_environments': [{'name': 'env{}'.format(i), 'order': 1}],
+            }
+            for i in range(size)
+        ],
+        'job_definitions': [
+            {
+                'name': 'job{}'.format(i),
+                'container': {'image': 'centos', 'memory': 128, 'vcpus': 1, 'command': 'echo ${greeting}'},
+                'parameters': {'greeting': 'hello'},
+            }
+            for i in range(size)
+        ],
+    }
+
+
+class Benchmarks(object):
+
+    def __init__(self, latency, workers, rate, quick):
+        self.latency = latency
+        self.workers = workers
+        self.rate = rate
+        self.quick = quick
+        self.results = []
+        self.tmp = tempfile.mkdtemp(prefix='beagle-bench-')
+
+    def sizes(self, *sizes):
+        return sizes[:1] if self.quick else sizes
+
+    def manager(self, batch, yml=None):
+        poller = Poller(floor=0.05, ceiling=0.2)
+        return BatchManager(yml or config_yml(1), poller=poller, batch=batch.client(max_pool_connections=64))
+
+    def record(self, name, size, batch, started, **extra):
+        result = {
+            'benchmark': name,
+            'size': size,
+            'seconds': round(time.time() - started, 4),
+            'calls': dict(batch.calls),
+        }
+        result.update(extra)
+        self.results.append(result)
+        print("{:<24} {:>8} {:>10.3f}s".format(name, size, result['seconds']), file=sys.stderr)
+
+    def quietly(self, func, *args, **kwargs):
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            return func(*args, **kwargs)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    def submit(self):
+        for size in self.sizes(1000, 10000, 100000):
+            filename = os.path.join(self.tmp, 'params-{}.csv'.format(size))
+            with open(filename, 'w') as f:
+                f.write('greeting,index\n')
+                for i in range(size):
+                    f.write('hello,{}\n'.format(i))
+            batch = LocalBatch(latency=self.latency)
+            mgr = self.manager(batch)
+            started = time.time()
+            # the stand-in never throttles, so the limiter would only measure its own ramp
+            limiter = AdaptiveRateLimiter(rate=self.rate, max_rate=self.rate)
+            report = mgr.submit_many(
+                'bench', 'job0', 'queue0', ParameterFile(filename), workers=self.workers, limiter=limiter
+            )
+            self.record('submit', size, batch, started, jobs_per_second=round(report.rate, 1))
+
+    def get_jobs(self):
+        for size in self.sizes(1000, 10000, 100000):
+            batch = LocalBatch(latency=self.latency)
+            statuses = BatchManager.JOB_STATUSES
+            for i in range(size):
+                batch.add_job('queue0', statuses[i % len(statuses)])
+            mgr = self.manager(batch)
+            started = time.time()
+            mgr.get_jobs('queue0')
+            self.record('get_jobs', size, batch, started)
+
+    def from_aws(self):
+        for size in self.sizes(10, 100, 500):
+            batch = LocalBatch(latency=self.latency)
+            for i in range(size):
+                batch.add_compute_environment('env{}'.format(i))
+                batch.add_queue('queue{}'.format(i), ['env{}'.format(i)])
+            yml = config_yml(size)
+            started = time.time()
+            mgr = self.manager(batch, yml)
+            constructed = time.time() - started
+            mgr.from_aws()
+            self.record('from_aws', size, batch, started, construct_seconds=round(constructed, 4))
+
+    def assemble_teardown(self):
+        for size in self.sizes(2, 10, 25):
+            batch = LocalBatch(latency=self.latency, settle=0.5)
+            mgr = self.manager(batch, config_yml(size))
+            started = time.time()
+            self.quietly(mgr.assemble)
+            self.record('assemble', size, batch, started)
+            batch.calls.clear()
+            started = time.time()
+            self.quietly(mgr.teardown)
+            self.record('teardown', size, batch, started)
+
+    def run(self, names):
+        try:
+            for name in names:
+                getattr(self, name)()
+        finally:
+            shutil.rmtree(self.tmp, ignore_errors=True)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.STDOUT).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+BENCHMARKS = ('submit', 'get_jobs', 'from_aws', 'assemble_teardown')
+
+
+@click.command()
+@click.option('--output', '-o', default='benchmarks.json', help="Where to write the results. Default: benchmarks.json")
+@click.option('--latency', default=0.02, type=float, help="Simulated seconds per API call. Default: 0.02")
+@click.option('--workers', default=16, type=int, help="Concurrency for submissions. Default: 16")
+@click.option('--rate', default=100000, type=float, help="Submission rate limit, in jobs per second. Default: 100000")
+@click.option('--quick', is_flag=True, default=False, help="Only run the smallest size of each benchmark")
+@click.argument('names', nargs=-1, type=click.Choice(BENCHMARKS))
+def main(output, latency, workers, rate, quick, names):
+    """
+    Run the named benchmarks (all of them by default) and write the results
+    to a JSON file.
+    """
+    benchmarks = Benchmarks(latency, workers, rate, quick)
+    benchmarks.run(names or BENCHMARKS)
+    with open(output, 'w') as f:
+        json.dump({
+            'commit': git_commit(),
+            'date': datetime.datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'latency': latency,
+            'workers': workers,
+            'rate': rate,
+            'results': benchmarks.results,
+        }, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
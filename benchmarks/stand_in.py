@@ -0,0 +1,247 @@
+"""
+An in-memory stand-in for the AWS Batch API, for benchmarking.
+
+:py:class:`LocalBatch` answers the calls of a real botocore Batch client
+from its ``before-call`` event, so requests are still built, validated and
+serialized exactly as they would be against AWS.  Only the network round
+trip is replaced, by a sleep of ``latency`` seconds.
+
+Queues and compute environments take ``settle`` seconds to become VALID
+after any change, or to disappear after a delete, which gives the wait
+loops of ``assemble`` and ``teardown`` something to wait for.
+"""
+import itertools
+import json
+import threading
+import time
+
+import boto3
+from botocore.awsrequest import AWSResponse
+
+
+class LocalBatch(object):
+
+    def __init__(self, latency=0.0, settle=0.5, region='us-west-2'):
+        self.latency = latency
+        self.settle = settle
+        self.region = region
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+        self.calls = {}
+        self.queues = {}
+        self.compute_environments = {}
+        self.job_definitions = {}
+        self.jobs = {}
+        # job ids by (queue, status), in submission order, for ListJobs
+        self.listings = {}
+
+    def client(self, max_pool_connections=50):
+        """
+        :rtype: a botocore Batch client whose calls we answer
+        """
+        session = boto3.session.Session(
+            aws_access_key_id='benchmark',
+            aws_secret_access_key='benchmark',
+            region_name=self.region
+        )
+        from batchbeagle.aws.client import make_batch_client
+        client = make_batch_client(session=session, max_pool_connections=max_pool_connections)
+        client.meta.events.register('before-parameter-build.batch', self._capture_params)
+        client.meta.events.register_last('before-call.batch', self._answer)
+        return client
+
+    def _capture_params(self, params, context, **kwargs):
+        context['stand_in_params'] = dict(params)
+
+    def _answer(self, model, context, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        handler = getattr(self, '_' + model.name)
+        with self.lock:
+            self.calls[model.name] = self.calls.get(model.name, 0) + 1
+            parsed = handler(**context['stand_in_params'])
+        # round trip through JSON so callers can't share our state
+        parsed = json.loads(json.dumps(parsed))
+        parsed.setdefault('ResponseMetadata', {'HTTPStatusCode': 200})
+        return AWSResponse('https://batch.local', 200, {}, None), parsed
+
+    def _arn(self, kind, name):
+        return 'arn:aws:batch:{}:123456789012:{}/{}'.format(self.region, kind, name)
+
+    # Seeding state without going through the API
+
+    def add_job(self, queue, status, name='job'):
+        job_id = 'job-{}'.format(next(self.ids))
+        self.jobs[job_id] = {
+            'jobId': job_id,
+            'jobName': name,
+            'jobQueue': queue,
+            'status': status,
+            'createdAt': int(time.time() * 1000),
+        }
+        self.listings.setdefault((queue, status), []).append(job_id)
+        return job_id
+
+    def _set_status(self, job_id, status):
+        job = self.jobs[job_id]
+        self.listings[(job['jobQueue'], job['status'])].remove(job_id)
+        job['status'] = status
+        self.listings.setdefault((job['jobQueue'], status), []).append(job_id)
+
+    def add_queue(self, name, compute_environments):
+        self.queues[name] = self._settled({
+            'jobQueueName': name,
+            'jobQueueArn': self._arn('job-queue', name),
+            'state': 'ENABLED',
+            'priority': 1,
+            'computeEnvironmentOrder': [
+                {'order': i + 1, 'computeEnvironment': self._arn('compute-environment', env)}
+                for i, env in enumerate(compute_environments)
+            ],
+        })
+
+    def add_compute_environment(self, name):
+        self.compute_environments[name] = self._settled({
+            'computeEnvironmentName': name,
+            'computeEnvironmentArn': self._arn('compute-environment', name),
+            'state': 'ENABLED',
+            'type': 'MANAGED',
+        })
+
+    def _settled(self, resource):
+        resource['status'] = 'VALID'
+        resource['readyAt'] = 0
+        return resource
+
+    # Queues and compute environments move through CREATING/UPDATING/DELETING
+    # for ``settle`` seconds after each change
+
+    def _change(self, resource, status):
+        resource['status'] = status
+        resource['readyAt'] = time.time() + self.settle
+
+    def _describe(self, resources, names, results_key, nextToken=None, **kwargs):
+        found = []
+        now = time.time()
+        for name in names or sorted(resources):
+            name = name.split('/')[-1]
+            resource = resources.get(name)
+            if resource is None:
+                continue
+            if resource['readyAt'] <= now:
+                if resource['status'] == 'DELETING':
+                    del resources[name]
+                    continue
+                if resource['status'] in ('CREATING', 'UPDATING'):
+                    resource['status'] = 'VALID'
+            found.append(dict((k, v) for k, v in resource.items() if k != 'readyAt'))
+        return {results_key: found}
+
+    def _DescribeJobQueues(self, jobQueues=None, **kwargs):
+        return self._describe(self.queues, jobQueues, 'jobQueues', **kwargs)
+
+    def _DescribeComputeEnvironments(self, computeEnvironments=None, **kwargs):
+        return self._describe(self.compute_environments, computeEnvironments, 'computeEnvironments', **kwargs)
+
+    def _CreateJobQueue(self, jobQueueName, state, priority, computeEnvironmentOrder, **kwargs):
+        self.queues[jobQueueName] = {
+            'jobQueueName': jobQueueName,
+            'jobQueueArn': self._arn('job-queue', jobQueueName),
+            'state': state,
+            'priority': priority,
+            'computeEnvironmentOrder': computeEnvironmentOrder,
+        }
+        self._change(self.queues[jobQueueName], 'CREATING')
+        return {'jobQueueName': jobQueueName, 'jobQueueArn': self.queues[jobQueueName]['jobQueueArn']}
+
+    def _UpdateJobQueue(self, jobQueue, **kwargs):
+        queue = self.queues[jobQueue.split('/')[-1]]
+        queue.update(kwargs)
+        self._change(queue, 'UPDATING')
+        return {'jobQueueName': queue['jobQueueName'], 'jobQueueArn': queue['jobQueueArn']}
+
+    def _DeleteJobQueue(self, jobQueue):
+        self._change(self.queues[jobQueue.split('/')[-1]], 'DELETING')
+        return {}
+
+    def _CreateComputeEnvironment(self, computeEnvironmentName, **kwargs):
+        env = dict(kwargs)
+        env.update({
+            'computeEnvironmentName': computeEnvironmentName,
+            'computeEnvironmentArn': self._arn('compute-environment', computeEnvironmentName),
+        })
+        env.setdefault('state', 'ENABLED')
+        self.compute_environments[computeEnvironmentName] = env
+        self._change(env, 'CREATING')
+        return {
+            'computeEnvironmentName': computeEnvironmentName,
+            'computeEnvironmentArn': env['computeEnvironmentArn'],
+        }
+
+    def _UpdateComputeEnvironment(self, computeEnvironment, **kwargs):
+        env = self.compute_environments[computeEnvironment.split('/')[-1]]
+        env.update(kwargs)
+        self._change(env, 'UPDATING')
+        return {
+            'computeEnvironmentName': env['computeEnvironmentName'],
+            'computeEnvironmentArn': env['computeEnvironmentArn'],
+        }
+
+    def _DeleteComputeEnvironment(self, computeEnvironment):
+        self._change(self.compute_environments[computeEnvironment.split('/')[-1]], 'DELETING')
+        return {}
+
+    # Job definitions
+
+    def _DescribeJobDefinitions(self, jobDefinitionName=None, status=None, **kwargs):
+        revisions = self.job_definitions.get(jobDefinitionName, [])
+        return {'jobDefinitions': [jd for jd in revisions if not status or jd['status'] == status]}
+
+    def _RegisterJobDefinition(self, jobDefinitionName, **kwargs):
+        revisions = self.job_definitions.setdefault(jobDefinitionName, [])
+        jd = dict(kwargs)
+        jd.update({
+            'jobDefinitionName': jobDefinitionName,
+            'revision': len(revisions) + 1,
+            'status': 'ACTIVE',
+        })
+        jd['jobDefinitionArn'] = self._arn('job-definition', '{}:{}'.format(jobDefinitionName, jd['revision']))
+        revisions.append(jd)
+        return {
+            'jobDefinitionName': jobDefinitionName,
+            'jobDefinitionArn': jd['jobDefinitionArn'],
+            'revision': jd['revision'],
+        }
+
+    def _DeregisterJobDefinition(self, jobDefinition):
+        for revisions in self.job_definitions.values():
+            for jd in revisions:
+                if jd['jobDefinitionArn'] == jobDefinition:
+                    jd['status'] = 'INACTIVE'
+        return {}
+
+    # Jobs
+
+    def _SubmitJob(self, jobName, jobQueue, jobDefinition, **kwargs):
+        job_id = self.add_job(jobQueue, 'SUBMITTED', jobName)
+        return {'jobName': jobName, 'jobId': job_id}
+
+    def _ListJobs(self, jobQueue=None, jobStatus='RUNNING', maxResults=100, nextToken=None, **kwargs):
+        # an offset is a good enough page token while nothing changes status
+        matching = self.listings.get((jobQueue, jobStatus), [])
+        start = int(nextToken or 0)
+        response = {'jobSummaryList': [self.jobs[job_id] for job_id in matching[start:start + maxResults]]}
+        if start + maxResults < len(matching):
+            response['nextToken'] = str(start + maxResults)
+        return response
+
+    def _DescribeJobs(self, jobs):
+        return {'jobs': [self.jobs[job_id] for job_id in jobs if job_id in self.jobs]}
+
+    def _CancelJob(self, jobId, reason):
+        self._set_status(jobId, 'FAILED')
+        return {}
+
+    def _TerminateJob(self, jobId, reason):
+        self._set_status(jobId, 'FAILED')
+        return {}
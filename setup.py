@@ -19,10 +19,17 @@ setup(name="batchbeagle",
       packages=find_packages(),
       include_package_data=True,
       install_requires=[
-          "boto3 >= 1.4.4",
+          "boto3 >= 1.12",
           "click >= 6.7",
           "PyYAML == 3.12"
       ],
+      extras_require={
+          # batchbeagle.aws.aio, Python 3 only
+          'async': ["aiobotocore >= 1.0"],
+          # compressed and columnar parameters files; see batchbeagle.params
+          'zstd': ["zstandard >= 0.15"],
+          'parquet': ["pyarrow >= 7.0"],
+      },
       entry_points={'console_scripts': [
           'beagle = batchbeagle.dplycli:main'
       ]}
@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from batchbeagle.journal import JournalExists, JournalMismatch, SubmissionJournal
+from batchbeagle.params import ParameterFile
+
+
+class SubmissionJournalTests(unittest.TestCase):
+
+    HEADER = {'name': 'job', 'jobDefinition': 'jd', 'queue': 'queue'}
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, 'params.csv')
+        self.write(b'a,b\n1,2\n\n3,4\n5,6\n7,8\n')
+        self.pfile = ParameterFile(self.filename)
+        self.rows = list(self.pfile.rows())
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, data):
+        with open(self.filename, 'wb') as f:
+            f.write(data)
+
+    def journal(self, **kwargs):
+        journal = SubmissionJournal(self.filename + '.journal')
+        journal.open(self.HEADER, **kwargs)
+        self.addCleanup(journal.close)
+        return journal
+
+    def test_resume_skips_submitted_rows(self):
+        journal = self.journal()
+        journal.record(self.rows[0], 'job-0')
+        journal.record(self.rows[2], 'job-2')
+        journal.close()
+        journal = self.journal(resume=True)
+        start = journal.resume_offset(self.pfile, self.pfile.data_start)
+        self.assertEqual(start, self.rows[1].offset)
+        pending = list(journal.pending(self.pfile.rows(start)))
+        self.assertEqual([row.offset for row in pending], [self.rows[1].offset, self.rows[3].offset])
+
+    def test_resume_offset_steps_over_blank_lines(self):
+        journal = self.journal()
+        journal.record_many(self.rows[:3], 'job-0')
+        self.assertEqual(journal.resume_offset(self.pfile, self.pfile.data_start), self.rows[3].offset)
+        journal.record(self.rows[3], 'job-3')
+        self.assertEqual(journal.resume_offset(self.pfile, self.pfile.data_start), os.path.getsize(self.filename))
+
+    def test_resume_offset_stops_at_end(self):
+        journal = self.journal()
+        journal.record_many(self.rows, 'job-0')
+        self.assertEqual(journal.resume_offset(self.pfile, self.pfile.data_start, self.rows[1].offset),
+                         self.rows[1].offset)
+
+    def test_changed_row_is_refused(self):
+        journal = self.journal()
+        journal.record_many(self.rows[:2], 'job-0')
+        self.write(b'a,b\n1,2\n\n3,9\n5,6\n7,8\n')
+        with self.assertRaises(JournalMismatch):
+            journal.resume_offset(self.pfile, self.pfile.data_start)
+
+    def test_resume_as_different_job_is_refused(self):
+        self.journal().record(self.rows[0], 'job-0')
+        journal = SubmissionJournal(self.filename + '.journal')
+        with self.assertRaises(JournalMismatch):
+            journal.open(dict(self.HEADER, queue='other'), resume=True)
+
+    def test_unfinished_journal_needs_restart(self):
+        journal = self.journal()
+        journal.record(self.rows[0], 'job-0')
+        journal.close()
+        with self.assertRaises(JournalExists):
+            self.journal()
+        self.assertEqual(self.journal(restart=True).completed, {})
+
+    def test_complete_journal_can_be_rerun(self):
+        journal = self.journal()
+        journal.record_many(self.rows, 'job-0')
+        journal.finish()
+        journal.close()
+        journal = self.journal()
+        self.assertEqual(journal.completed, {})
+        self.assertFalse(journal.complete)
+
+    def test_resumed_records_reopen_a_complete_journal(self):
+        journal = self.journal()
+        journal.record(self.rows[0], 'job-0')
+        journal.finish()
+        journal.close()
+        self.journal(resume=True).record(self.rows[1], 'job-1')
+        loaded = SubmissionJournal(self.filename + '.journal')
+        loaded.load()
+        self.assertFalse(loaded.complete)
+        self.assertEqual(len(loaded.completed), 2)
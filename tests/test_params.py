@@ -0,0 +1,44 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from batchbeagle.params import ParameterFile
+
+
+class ShardTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, 'params.csv')
+        with open(self.filename, 'wb') as f:
+            f.write(b'n,word\n')
+            for n in range(100):
+                f.write('{},{}\n'.format(n, 'x' * (n % 7)).encode('utf-8'))
+        self.pfile = ParameterFile(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read(self, shards):
+        return [row['n'] for start, end in shards for row in self.pfile.rows(start, end)]
+
+    def test_shards_cover_every_row_once(self):
+        for count in (1, 2, 3, 7, 100, 150):
+            shards = self.pfile.shards(count)
+            self.assertLessEqual(len(shards), count)
+            self.assertEqual(self.read(shards), [str(n) for n in range(100)])
+
+    def test_shards_start_on_line_boundaries(self):
+        index = self.pfile.index()
+        offsets = set(index[n] for n in range(len(index)))
+        for start, end in self.pfile.shards(9):
+            self.assertIn(start, offsets)
+            self.assertTrue(end in offsets or end == os.path.getsize(self.filename))
+
+    def test_shards_of_a_range(self):
+        start, end = self.pfile.span(10, 60)
+        shards = self.pfile.shards(4, start, end)
+        self.assertEqual(shards[0][0], start)
+        self.assertEqual(shards[-1][1], end)
+        self.assertEqual(self.read(shards), [str(n) for n in range(10, 60)])
@@ -0,0 +1,37 @@
+import unittest
+
+from batchbeagle.aws.plan import ResourcePlan, diff
+
+
+class DiffTests(unittest.TestCase):
+
+    def test_unchanged(self):
+        self.assertEqual(diff({'a': 1, 'b': [1, 2]}, {'a': 1, 'b': [1, 2]}), [])
+
+    def test_only_desired_keys_are_compared(self):
+        self.assertEqual(diff({'a': 1}, {'a': 1, 'defaulted': 'yes'}), [])
+
+    def test_changes_are_reported_by_dotted_path(self):
+        desired = {'state': 'ENABLED', 'computeResources': {'maxvCpus': 64, 'minvCpus': 0}}
+        live = {'state': 'DISABLED', 'computeResources': {'maxvCpus': 32, 'minvCpus': 0}}
+        self.assertEqual(diff(desired, live), [
+            ('computeResources.maxvCpus', 32, 64),
+            ('state', 'DISABLED', 'ENABLED'),
+        ])
+
+    def test_missing_live_values(self):
+        self.assertEqual(diff({'a': {'b': 1}}, None), [('a', None, {'b': 1})])
+        self.assertEqual(diff({'a': {'b': 1}}, {'a': {}}), [('a.b', None, 1)])
+
+    def test_lists_are_compared_whole(self):
+        self.assertEqual(diff({'subnets': ['a', 'b']}, {'subnets': ['b', 'a']}),
+                         [('subnets', ['b', 'a'], ['a', 'b'])])
+
+    def test_ignored_paths(self):
+        desired = {'computeResources': {'desiredvCpus': 4, 'maxvCpus': 64}}
+        live = {'computeResources': {'desiredvCpus': 12, 'maxvCpus': 64}}
+        self.assertEqual(diff(desired, live, ignore=('computeResources.desiredvCpus',)), [])
+
+    def test_describe(self):
+        plan = ResourcePlan('queue', 'q', ResourcePlan.UPDATE, [('priority', 1, 2)])
+        self.assertEqual(plan.describe(), ['~ queue q', '    priority: 1 -> 2'])
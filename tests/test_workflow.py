@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from batchbeagle.workflow import Dependency, Step, Workflow, WorkflowError
+
+
+class WorkflowTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, text):
+        filename = os.path.join(self.dir, name)
+        with open(filename, 'w') as f:
+            f.write(text)
+        return filename
+
+    def levels(self, workflow):
+        return [[step.id for step in level] for level in workflow.levels()]
+
+    def test_levels(self):
+        workflow = Workflow([
+            Step('load', 'jd', depends_on=[Dependency('transform'), Dependency('extract')]),
+            Step('transform', 'jd', depends_on=[Dependency('extract')]),
+            Step('extract', 'jd'),
+            Step('report', 'jd'),
+        ])
+        self.assertEqual(self.levels(workflow), [['extract', 'report'], ['transform'], ['load']])
+
+    def test_cycle(self):
+        with self.assertRaises(WorkflowError):
+            Workflow([Step('a', 'jd', depends_on=[Dependency('b')]), Step('b', 'jd', depends_on=[Dependency('a')])])
+
+    def test_unknown_dependency(self):
+        with self.assertRaises(WorkflowError):
+            Workflow([Step('a', 'jd', depends_on=[Dependency('b')])])
+
+    def test_n_to_n_needs_arrays_of_the_same_size(self):
+        Workflow([Step('a', 'jd', array_size=4), Step('b', 'jd', array_size=4, depends_on=[Dependency('a', 'N_TO_N')])])
+        with self.assertRaises(WorkflowError):
+            Workflow([Step('a', 'jd', array_size=4), Step('b', 'jd', array_size=5, depends_on=[Dependency('a', 'N_TO_N')])])
+
+    def test_from_yaml(self):
+        filename = self.write('workflow.yml', """
+jobs:
+  - id: extract
+    job_definition: jd
+    array_size: 10
+  - id: transform
+    job_definition: jd
+    array_size: 10
+    depends_on: extract:N_TO_N
+  - id: load
+    job_definition: jd
+    parameters:
+      batch: 3
+    depends_on: [transform]
+""")
+        workflow = Workflow.from_file(filename, ['jd'])
+        self.assertEqual(self.levels(workflow), [['extract'], ['transform'], ['load']])
+        self.assertEqual(workflow.steps['load'].parameters, {'batch': '3'})
+        self.assertEqual(workflow.steps['transform'].depends_on[0].type, 'N_TO_N')
+
+    def test_from_csv(self):
+        filename = self.write('workflow.csv', "id,job_definition,depends_on,table\na,jd,,x\nb,jd,a,y\nc,jd,a b,z\n")
+        workflow = Workflow.from_file(filename)
+        self.assertEqual(self.levels(workflow), [['a'], ['b'], ['c']])
+        self.assertEqual(workflow.steps['c'].parameters, {'table': 'z'})
+
+    def test_bad_files(self):
+        bad = {
+            'missing.yml': None,
+            'malformed.yml': "jobs: [a: b: c",
+            'no_jobs.yml': "steps: []\n",
+            'no_id.yml': "jobs:\n  - job_definition: jd\n",
+            'no_job_definition.yml': "jobs:\n  - id: a\n",
+            'no_dependency_id.yml': "jobs:\n  - id: a\n    job_definition: jd\n    depends_on: [{type: N_TO_N}]\n",
+            'unknown_job_definition.yml': "jobs:\n  - id: a\n    job_definition: other\n",
+            'no_id.csv': "job_definition,depends_on\njd,\n",
+        }
+        for name, text in bad.items():
+            filename = self.write(name, text) if text is not None else os.path.join(self.dir, name)
+            with self.assertRaises(WorkflowError):
+                Workflow.from_file(filename, ['jd'])